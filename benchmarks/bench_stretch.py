@@ -0,0 +1,79 @@
+"""Compare the phase vocoder and WSOLA stretch engines.
+
+    python benchmarks/bench_stretch.py [track.mp3] [--rates 0.65 0.85 1.25] [--seconds 30]
+
+Without a track a synthetic drum loop is used. For each rate it prints the
+render time, the realtime factor and how sharp the onsets stay (mean onset
+strength peak of the result relative to the input). WSOLA is timed twice:
+"wsola" includes the beat tracking it needs, the way a first stretch of a state
+pays for it, and "wsola*" reuses the cached grid, like a re-render does.
+"""
+import argparse
+import os
+import sys
+import time
+import numpy as np
+import librosa
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from djskrewcore.effects import AudioEffects, beat_grid_cache
+
+def synthetic_loop(sr: int, seconds: float, bpm: float = 90.0) -> np.ndarray:
+    rng = np.random.default_rng(0)
+    n = int(sr * seconds)
+    t = np.arange(n) / sr
+    y = 0.2 * np.sin(2 * np.pi * 55 * t)
+    beat = int(sr * 60 / bpm)
+    hit = rng.standard_normal(2048) * np.exp(-np.arange(2048) / 150.0)
+    for start in range(0, n - len(hit), beat // 2):
+        y[start:start + len(hit)] += hit * (0.8 if (start // (beat // 2)) % 2 == 0 else 0.4)
+    return (y / np.max(np.abs(y))).astype('float32')
+
+def onset_sharpness(y: np.ndarray, sr: int) -> float:
+    onset_env = librosa.onset.onset_strength(y=y, sr=sr)
+    peaks = librosa.util.peak_pick(onset_env, pre_max=3, post_max=3, pre_avg=3, post_avg=5, delta=0.5, wait=10)
+    return float(np.mean(onset_env[peaks])) if len(peaks) else 0.0
+
+def timed(render):
+    start = time.perf_counter()
+    result = render()
+    return result, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the time stretch engines")
+    parser.add_argument("track", nargs="?", help="Audio file to stretch (default: synthetic drum loop)")
+    parser.add_argument("--rates", type=float, nargs="+", default=[0.65, 0.85, 1.25, 2.0])
+    parser.add_argument("--seconds", type=float, default=30.0, help="Length of audio to use")
+    parser.add_argument("--sr", type=int, default=44100)
+    args = parser.parse_args()
+
+    if args.track:
+        y, sr = librosa.load(args.track, sr=args.sr, duration=args.seconds)
+    else:
+        sr = args.sr
+        y = synthetic_loop(sr, args.seconds)
+    duration = len(y) / sr
+    reference = onset_sharpness(y, sr)
+
+    # bpm: estimates the tempo before either engine runs, so it pays this on top
+    beat_grid_cache.clear()
+    _, bpm_time = timed(lambda: AudioEffects.estimate_bpm(y, sr))
+    print(f"{duration:.1f}s of audio at {sr} Hz, bpm: adds {bpm_time:.2f}s of tempo estimation to either engine")
+    print(f"{'rate':>6} {'engine':>8} {'seconds':>8} {'x realtime':>10} {'onsets':>7}")
+
+    for rate in args.rates:
+        engines = [
+            ('vocoder', lambda: AudioEffects.time_stretch(y, rate=rate), False),
+            ('wsola', lambda: AudioEffects.wsola_stretch(y, sr, rate=rate), False),
+            ('wsola*', lambda: AudioEffects.wsola_stretch(y, sr, rate=rate), True),
+        ]
+        for name, render, warm in engines:
+            if not warm:
+                beat_grid_cache.clear()
+            stretched, seconds = timed(render)
+            sharpness = onset_sharpness(stretched, sr) / reference if reference else 0.0
+            print(f"{rate:>6.2f} {name:>8} {seconds:>8.3f} {duration / seconds:>10.1f} {sharpness:>7.2f}")
+    beat_grid_cache.clear()
+
+if __name__ == "__main__":
+    main()
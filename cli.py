@@ -1,4 +1,5 @@
-from typing import Optional
+from typing import Optional, List
+import os
 import sys
 import threading
 import time
@@ -62,54 +63,93 @@ def print_controls():
     print("u; - Undo last operation")
     print("r; - Redo last undone operation")
     print("l; - Load a new audio file")
+    print("k; - Keep the variation that is playing")
+    print("i; - Show playback health (callback timing, xruns, lock waits)")
+    print("m; - Save playback health metrics as JSON")
     print("h; - Print this help message")
+    print("quality:draft; - Render quick drafts (quality:final; for full quality, saving always uses final)")
     print("\nCommand syntax:")
     print("command:value1:value2:value3;")
     print("Examples:")
     print("- p:-2;              (Lower pitch by 2 semitones)")
     print("- loop:2:8:4;        (2-beat loops, 8 beats long, every 4 beats)")
     print("- rev:1:4:2;         (Reverse every beat, 4 beats long, every 2 beats)")
+    print("- t:0.65:1;          (Slow down with the WSOLA engine, keeps drum hits tight)")
+    print("- stut:1:3:1:1@17-32; (Stutter only bars 17 to 32)")
+    print("- loop:1:4:2;|loop:1:6:2;|stut:1:3:1:1; (Render three variations, then v:1; v:2; ... and k;)")
+    print("- src:other.mp3; layer:16:4:8:0.6; (Layer 4 beats of other.mp3 from beat 16 every 8 beats)")
+    print("- stut:1:3:1:1~p;    (Stutter only the drums; ~h targets the harmonic part)")
+    print("- 3=p:-4;            (Change operation 3 of the chain, see o;, and re-render only from there)")
+    print("- 2+echo:0.5:3:0.7;  (Insert after operation 2), 5-; (Remove operation 5)")
     print("\nNote: All commands must end with a semicolon (;)")
 
+def download_tracks(url: str, limit: Optional[int] = None) -> List[str]:
+    """Download the native audio of a video or a whole playlist (its first limit entries)"""
+    from djskrewcore.yt_downloader import download_audio
+    output_path = "."
+    return download_audio(url, output_path, limit=limit)
+
 def main():
     # Parse command line arguments
-    file_path = None
+    file_paths: List[str] = []
     commands = None
+    record_path = None
+    if '--record' in sys.argv[:-1]:
+        index = sys.argv.index('--record')
+        record_path = sys.argv[index + 1]
+        del sys.argv[index:index + 2]
     
+    if len(sys.argv) > 2:
+        commands = sys.argv[2]
+
     if len(sys.argv) > 1:
         arg = sys.argv[1]
         if arg.startswith('https'):
-            from djskrewcore.yt_downloader import download_video
-            url = arg
-            output_path = "."
-            file_path = download_video(url, output_path)
+            # Commands run on every track of a playlist, an interactive session edits only one
+            file_paths = download_tracks(arg, limit=None if commands else 1)
+            if not file_paths:
+                print("Nothing could be downloaded.")
+                return
         else:
-            file_path = arg
-        
-        if len(sys.argv) > 2:
-            commands = sys.argv[2]
+            file_paths = [arg]
     
     # Get file path if not provided
-    if not file_path:
+    if not file_paths:
         file_path = input("Enter the path to your audio file (or leave blank to download from YouTube): ")
-        if not file_path:
-            from djskrewcore.yt_downloader import download_video
+        if file_path:
+            file_paths = [file_path]
+        else:
             url = input("Enter the YouTube video URL: ")
-            output_path = "."
-            file_path = download_video(url, output_path)
+            file_paths = download_tracks(url, limit=1)
+            if not file_paths:
+                print("Nothing could be downloaded.")
+                return
 
-    # Create audio manager
-    audio_manager = AudioManager(file_path)
-    print(f"\nLoaded audio file: {file_path}")
-    
-    # Handle command-line commands
+    # Handle command-line commands, once for every downloaded track
     if commands:
-        print(f"Processing commands: {commands}")
-        audio_manager.process_instructions(commands)
-        audio_manager._save_current_state()
-        print("\nProcessing complete. File saved.")
-        audio_manager.cleanup()
+        for i, file_path in enumerate(file_paths, start=1):
+            track_record_path = record_path
+            if record_path and len(file_paths) > 1:
+                # One log per track of a playlist
+                root, ext = os.path.splitext(record_path)
+                track_record_path = f"{root}_{i}{ext}"
+            audio_manager = AudioManager(file_path, record_path=track_record_path)
+            print(f"\nLoaded audio file: {file_path}")
+            if track_record_path:
+                print(f"Recording the session to {track_record_path}")
+            print(f"Processing commands: {commands}")
+            audio_manager.process_instructions(commands)
+            audio_manager._save_current_state()
+            print("\nProcessing complete. File saved.")
+            audio_manager.cleanup()
         return
+
+    # Create audio manager
+    file_path = file_paths[0]
+    audio_manager = AudioManager(file_path, record_path=record_path)
+    print(f"\nLoaded audio file: {file_path}")
+    if record_path:
+        print(f"Recording the session to {record_path} (replay with: python replay.py {record_path})")
     
     # Enter interactive mode
     print_controls()
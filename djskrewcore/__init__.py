@@ -1,3 +1,7 @@
-# Import the download_video function to make it accessible from the package
-from .yt_downloader import download_video  # Ensure the correct relative import
+import os
 
+# Persist numba-compiled kernels (librosa, resampy) across runs; set before librosa is imported
+os.environ.setdefault("NUMBA_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "djskrewdriver", "numba"))
+
+# Import the download functions to make them accessible from the package
+from .yt_downloader import download_video, download_audio  # Ensure the correct relative import
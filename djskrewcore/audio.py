@@ -1,4 +1,4 @@
-from typing import Optional, List, Tuple, Dict, Any
+from typing import Optional, List, Tuple, Dict, Any, Callable
 import os
 import threading
 import queue
@@ -11,11 +11,83 @@ import soundfile as sf
 import numpy as np
 import sounddevice as sd
 from djskrewcore.effects import AudioEffects
+from djskrewcore.spectral import as_spectral, as_audio
+from djskrewcore.pcmstore import (PCMStore, PCM_EXTENSION, read_audio, read_pcm, write_pcm, audio_frames,
+                                  is_pcm, pcm_info)
+from djskrewcore.metrics import CallbackMetrics
+from djskrewcore.loader import ProgressiveLoader, load_audio
+from djskrewcore.chain import OperationChain
+from djskrewcore.recorder import SessionRecorder
+from djskrewcore.warmup import start_warmup
+from djskrewcore.worker import RenderWorkerPool
+from djskrewcore.progress import ProgressReporter, CostModel
+from djskrewcore import progress
 import re
-import time
 import traceback
+from time import perf_counter
+from concurrent.futures import ThreadPoolExecutor
 from pydub import AudioSegment
 
+# Operations that change the track's timeline, so the playhead has to be remapped
+STRETCH_OPERATIONS = {'t', 'bpm'}
+
+# Operations that can take and return an STFT, so consecutive ones skip the round trip
+SPECTRAL_OPERATIONS = {'t', 'bpm', 'p'}
+
+# Operations that read beats from the second track loaded with src:<path>;
+SOURCE_OPERATIONS = {'layer', 'splice'}
+
+# Beat effects that write their edit list into an output buffer the render can hand them
+EDIT_LIST_OPERATIONS = {'loop', 'chop', 'stut', 'rev', 'mash'}
+
+# "~h" / "~p" after a command applies it to the harmonic or percussive part only
+STEM_SUFFIXES = {'h': 'harmonic', 'p': 'percussive'}
+
+# Optional last value of t: and bpm:, picks the stretcher
+STRETCH_ENGINES = {0: 'vocoder', 1: 'wsola'}
+
+# Alternatives rendered at the same time by the variations command, each in its own render worker
+VARIATION_WORKERS = 3
+
+# Render settings; "final" is the full quality every render used to run at
+QUALITY_PROFILES = {
+    'draft': {'res_type': 'kaiser_fast', 'n_fft': 1024, 'hop_length': 512, 'beat_hop_length': 1024, 'enhance': False},
+    'standard': {'res_type': 'kaiser_fast', 'n_fft': 2048, 'hop_length': 512, 'beat_hop_length': 512, 'enhance': True},
+    'final': {'res_type': 'kaiser_best', 'n_fft': 2048, 'hop_length': 512, 'beat_hop_length': 512, 'enhance': True},
+}
+DEFAULT_QUALITY = 'final'
+
+# Decoded before playback starts, the rest of the track keeps decoding in the background
+PREVIEW_SECONDS = 10.0
+
+# Excerpt of a src: track that its tempo is estimated from: (offset, duration) in seconds
+SOURCE_TEMPO_EXCERPT = (30.0, 30.0)
+
+# Memory kept for rendered intermediates of the editable operation chain
+CHAIN_CHECKPOINT_BYTES = 512 * 1024 ** 2
+
+# Predicted render time above which a chain gets a warning before it starts
+EXPENSIVE_RENDER_SECONDS = 60.0
+
+# Commands that work while the tail of the track is still decoding
+STREAMING_COMMANDS = {'p;', 'q;', 'h;', 'i;', 'm;'}
+
+# Audio rendered on each side of a region so effects and mastering see real context
+REGION_CONTEXT_SECONDS = 2.0
+REGION_CROSSFADE = 1024
+REGION_UNITS = {'': 'bar', 'b': 'beat', 's': 's'}
+
+def stretch_engine(operation: Dict[str, Any]) -> str:
+    values = operation['values']
+    if operation['type'] in STRETCH_OPERATIONS and len(values) >= 2:
+        return STRETCH_ENGINES.get(int(values[1]), 'vocoder')
+    return 'vocoder'
+
+def is_spectral(operation: Dict[str, Any]) -> bool:
+    """WSOLA stretches and stem edits work on samples, so they break a spectral chain"""
+    return (operation['type'] in SPECTRAL_OPERATIONS and stretch_engine(operation) == 'vocoder'
+            and not operation.get('stem'))
+
 class AudioHistory:
     def __init__(self, max_size: int = 50):
         self.history: deque = deque(maxlen=max_size)
@@ -65,30 +137,130 @@ class AudioHistory:
                 pass
 
 class AudioPlayer:
-    def __init__(self, sr: int):
+    # How many beats apart the switch points for a queued buffer are
+    QUANTIZE_BEATS = {'beat': 1, 'bar': 4}
+    BLOCKSIZE = 2048
+
+    def __init__(self, sr: int, quantize: Optional[str] = 'beat',
+                 analyze: Optional[Callable[[np.ndarray, int], np.ndarray]] = None):
         self.sr = sr
+        self.quantize = quantize
+        # Beat tracker for buffers that arrive without a grid, AudioProcessor.beat_grid runs it off-process
+        self.analyze = analyze or AudioEffects.beat_samples
         self.is_playing = False
         self.stream: Optional[sd.OutputStream] = None
         self.audio_data: Optional[np.ndarray] = None
+        self.beat_samples: np.ndarray = np.zeros(0, dtype=np.int64)
         self.current_position = 0
+        self._pending: Optional[Tuple[np.ndarray, np.ndarray, float]] = None
+        self._generation = 0
         self._lock = threading.Lock()
+        self.metrics = CallbackMetrics(sr, self.BLOCKSIZE)
         
-    def load_audio(self, file_path: str) -> None:
+    def set_audio(self, audio_data: np.ndarray) -> None:
+        """Play already decoded samples without reading them back from disk"""
         with self._lock:
+            self._set_audio_locked(np.asarray(audio_data, dtype='float32'))
+        self._analyze_async(self.audio_data)
+
+    def extend_audio(self, audio_data: np.ndarray) -> None:
+        """Swap in a longer buffer that starts with the samples playing now, keeping the playhead"""
+        with self._lock:
+            self.audio_data = self._as_frames(np.asarray(audio_data, dtype='float32'))
+        self._analyze_async(self.audio_data)
+
+    def _set_audio_locked(self, audio_data: np.ndarray) -> None:
+        self.audio_data = self._as_frames(audio_data)
+        self.beat_samples = np.zeros(0, dtype=np.int64)
+        self.current_position = min(self.current_position, len(self.audio_data))
+
+    @staticmethod
+    def _as_frames(audio_data: np.ndarray) -> np.ndarray:
+        if len(audio_data.shape) == 1:
+            return audio_data.reshape(-1, 1)
+        return audio_data
+
+    def _beat_grid(self, audio_data: np.ndarray) -> np.ndarray:
+        try:
+            mono = audio_data.mean(axis=1) if audio_data.shape[1] > 1 else audio_data[:, 0]
+            return self.analyze(mono, self.sr)
+        except Exception as e:
+            print(f"Warning: Beat analysis for playback failed: {str(e)}")
+            return np.zeros(0, dtype=np.int64)
+
+    def _analyze_async(self, audio_data: np.ndarray) -> None:
+        def analyze():
+            beats = self._beat_grid(audio_data)
+            with self._lock:
+                if self.audio_data is audio_data:
+                    self.beat_samples = beats
+        thread = threading.Thread(target=analyze)
+        thread.daemon = True
+        thread.start()
+
+    def queue_audio(self, file_path: str, time_scale: float = 1.0, beats: Optional[np.ndarray] = None) -> None:
+        """Load a new buffer off the audio thread and switch to it on the next beat or bar.
+
+        time_scale maps the playhead into the new buffer, e.g. 1/rate after a
+        time stretch, so playback continues at the same musical position.
+        beats is the buffer's grid in samples when the renderer already knows it.
+        """
+        self._generation += 1
+        generation = self._generation
+
+        def prepare():
             try:
-                audio_data, sr = sf.read(file_path, dtype='float32')
-                if len(audio_data.shape) == 1:
-                    self.audio_data = audio_data.reshape(-1, 1)
-                else:
-                    self.audio_data = audio_data
-                self.current_position = min(self.current_position, len(self.audio_data))
+                audio_data, sr = read_audio(file_path)
             except Exception as e:
                 print(f"Error loading audio: {str(e)}")
-                self.audio_data = np.zeros((1024, 1), dtype='float32')
-                self.current_position = 0
+                return
+            self._stage(audio_data, time_scale, generation, beats)
+
+        thread = threading.Thread(target=prepare)
+        thread.daemon = True
+        thread.start()
+
+    def queue_swap(self, audio_data: np.ndarray, time_scale: float = 1.0,
+                   beats: Optional[np.ndarray] = None) -> None:
+        """Switch to already decoded samples on the next beat or bar"""
+        self._generation += 1
+        self._stage(audio_data, time_scale, self._generation, beats)
+
+    def _stage(self, audio_data: np.ndarray, time_scale: float, generation: int,
+               beats: Optional[np.ndarray] = None) -> None:
+        audio_data = self._as_frames(np.asarray(audio_data, dtype='float32'))
+        if beats is None:
+            beats = self._beat_grid(audio_data)
+        pending = (audio_data, beats, time_scale)
+        with self._lock:
+            if generation != self._generation:
+                return  # A newer buffer was queued while this one was prepared
+            if self.is_playing:
+                # The callback picks this up and swaps on the next switch point
+                self._pending = pending
+            else:
+                self._swap(pending, self.current_position)
+
+    def _swap(self, pending: Tuple[np.ndarray, np.ndarray, float], boundary: int) -> None:
+        audio_data, beats, time_scale = pending
+        if self._pending is pending:
+            self._pending = None
+        self.audio_data = audio_data
+        self.beat_samples = beats
+        self.current_position = min(int(boundary * time_scale), len(audio_data))
+
+    def _next_switch_point(self) -> int:
+        step = self.QUANTIZE_BEATS.get(self.quantize, 0)
+        if not step or len(self.beat_samples) == 0:
+            return self.current_position
+        beats = self.beat_samples[::step]
+        i = int(np.searchsorted(beats, self.current_position))
+        return int(beats[i]) if i < len(beats) else len(self.audio_data)
         
     def start_playback(self, position: Optional[int] = None) -> None:
         with self._lock:
+            if self._pending is not None:
+                self._swap(self._pending, self.current_position)
             if position is not None:
                 self.current_position = min(position, len(self.audio_data))
             if self.stream is not None:
@@ -98,7 +270,7 @@ class AudioPlayer:
                     samplerate=self.sr,
                     channels=self.audio_data.shape[1] if len(self.audio_data.shape) > 1 else 1,
                     callback=self._play_callback,
-                    blocksize=2048,
+                    blocksize=self.BLOCKSIZE,
                     dtype=self.audio_data.dtype
                 )
                 self.stream.start()
@@ -125,80 +297,124 @@ class AudioPlayer:
 
     def _play_callback(self, outdata: np.ndarray, frames: int, 
                       time: Any, status: Optional[sd.CallbackFlags]) -> None:
+        # Runs on the real-time thread: no printing, problems are only counted
+        start = perf_counter()
         if status:
-            print(status)
-            
-        with self._lock:
+            self.metrics.record_status(status, frames)
+
+        if not self._lock.acquire(blocking=False):
+            self.metrics.contended += 1
+            self._lock.acquire()
+        acquired = perf_counter()
+        try:
             if self.audio_data is None or self.current_position >= len(self.audio_data):
                 self.current_position = 0
                 
             try:
-                remaining = len(self.audio_data) - self.current_position
-                if remaining < frames:
-                    outdata[:remaining] = self.audio_data[self.current_position:]
-                    outdata[remaining:] = 0
-                    self.current_position = 0
-                else:
-                    outdata[:] = self.audio_data[self.current_position:self.current_position + frames]
-                    self.current_position += frames
-            except Exception as e:
-                print(f"Playback error: {str(e)}")
+                written = 0
+                pending = self._pending
+                if pending is not None:
+                    switch_at = self._next_switch_point() - self.current_position
+                    if switch_at < frames:
+                        written = self._fill(outdata, 0, switch_at)
+                        self._swap(pending, self.current_position)
+                        if self.current_position >= len(self.audio_data):
+                            self.current_position = 0
+                self._fill(outdata, written, frames)
+            except Exception:
+                self.metrics.record_error(frames)
                 outdata.fill(0)
+        finally:
+            self._lock.release()
+        self.metrics.record(start, acquired, perf_counter(), frames)
+
+    def _fill(self, outdata: np.ndarray, start: int, end: int) -> int:
+        """Copy the current buffer into outdata[start:end], returns the frames written"""
+        frames = end - start
+        if frames <= 0:
+            return start
+        remaining = len(self.audio_data) - self.current_position
+        if remaining < frames:
+            outdata[start:start + remaining] = self.audio_data[self.current_position:]
+            outdata[start + remaining:end] = 0
+            self.current_position = 0
+        else:
+            outdata[start:end] = self.audio_data[self.current_position:self.current_position + frames]
+            self.current_position += frames
+        return end
 
 class AudioProcessor:
-    def __init__(self, temp_dir: str):
+    # Operations whose output differs between runs are never served from the cache
+    UNCACHEABLE_OPERATIONS = {'mash'}
+
+    def __init__(self, temp_dir: str, store: Optional[PCMStore] = None, quality: str = DEFAULT_QUALITY,
+                 use_worker: bool = False, workers: int = 1):
         self.temp_dir = temp_dir
+        self.store = store or PCMStore(temp_dir)
+        self.quality = quality
+        # Render in child processes so effects never compete with playback for the GIL
+        self.worker: Optional[RenderWorkerPool] = RenderWorkerPool(workers) if use_worker else None
+        # Beat grids the worker sent back with each output file, in samples
+        self.beat_grids: Dict[str, np.ndarray] = {}
+        self.cost_model = CostModel()
         self.processing_queue: queue.Queue = queue.Queue()
         self.completion_callbacks: Dict[int, Any] = {}
+        # Set once an operation's render has finished or failed, see wait()
+        self.completion_events: Dict[int, threading.Event] = {}
+        self.render_cache: Dict[Tuple[str, str], str] = {}
         self.current_operation_id = 0
         self._lock = threading.Lock()
+        # Failures since the last take_errors(), for callers that are not watching the console
+        self.errors: List[str] = []
+        # Decoded second tracks for layer/splice, keyed by (path, sr)
+        self._sources: Dict[Tuple[str, int], np.ndarray] = {}
         self._processing_thread = threading.Thread(target=self._processing_loop)
         self._processing_thread.daemon = True
         self._processing_thread.start()
 
     def process_audio(self, input_file: str, operations: List[Dict[str, Any]], 
-                     callback: Any) -> int:
+                     callback: Any, quality: Optional[str] = None) -> int:
         with self._lock:
             operation_id = self.current_operation_id
             self.current_operation_id += 1
-            
-            base_name = os.path.basename(input_file)
-            name_without_extension = os.path.splitext(base_name)[0]
-            
-            if "(djskrewdriver remix)" not in name_without_extension:
-                remix_name = f"{name_without_extension} (djskrewdriver remix)"
-            else:
-                remix_name = name_without_extension
-            
-            output_file = os.path.join(self.temp_dir, f"{remix_name}.wav")
-            
-            index = 1
-            while os.path.exists(output_file):
-                output_file = os.path.join(self.temp_dir, f"{remix_name} {index}.wav")
-                index += 1
-            
+            quality = quality or self.quality
+
+            cache_key = self._cache_key(input_file, operations, quality)
+            cached_file = self.render_cache.get(cache_key) if cache_key else None
+            if cached_file and os.path.exists(cached_file):
+                callback(cached_file)
+                return operation_id
+
+            output_file = self.store.new_path()
             self.completion_callbacks[operation_id] = callback
-            self.processing_queue.put((operation_id, input_file, output_file, operations))
+            self.completion_events[operation_id] = threading.Event()
+            self.processing_queue.put((operation_id, input_file, output_file, operations, quality))
             
             return operation_id
 
+    def wait(self, operation_id: int) -> None:
+        """Block until an operation from process_audio() has finished"""
+        with self._lock:
+            event = self.completion_events.get(operation_id)
+        if event is not None:
+            event.wait()
+
+    def _cache_key(self, input_file: str, operations: List[Dict[str, Any]],
+                   quality: str) -> Optional[Tuple[str, str]]:
+        if any(op['type'] in self.UNCACHEABLE_OPERATIONS for op in operations):
+            return None
+        return (input_file, f"{quality}:{operations!r}")
+
     def _processing_loop(self) -> None:
         while True:
             try:
-                operation_id, input_file, output_file, operations = self.processing_queue.get()
+                item = self.processing_queue.get()
+                if item is None:
+                    return  # close()
+                operation_id, input_file, output_file, operations, quality = item
                 
                 try:
-                    y, sr = librosa.load(input_file, sr=None)
-                    modified_audio = np.copy(y)
-
-                    # Apply the requested effects
-                    for operation in operations:
-                        modified_audio = self._apply_effect(modified_audio, sr, operation)
-
-                    # Post-processing for quality improvement
-                    modified_audio = self._enhance_audio_quality(modified_audio, y, sr)
-
-                    sf.write(output_file, modified_audio, sr)
+                    self._render_to_file(input_file, output_file, operations, quality)
 
                     callback = self.completion_callbacks.get(operation_id)
                     if callback:
@@ -212,11 +428,322 @@ class AudioProcessor:
                     print(f"Operations: {operations}")
                     print(f"Error details: {str(e)}")
                     traceback.print_exc()
+                    self._record_error(f"{operations}: {str(e)}")
+                    # Release the waiting caller; the state stays as it was
+                    self.completion_callbacks.pop(operation_id, None)
+                finally:
+                    with self._lock:
+                        event = self.completion_events.pop(operation_id, None)
+                    if event is not None:
+                        event.set()
 
             except queue.Empty:
                 continue
 
-    def _enhance_audio_quality(self, modified_audio: np.ndarray, original_audio: np.ndarray, sr: int) -> np.ndarray:
+    def _record_error(self, message: str) -> None:
+        with self._lock:
+            self.errors.append(message)
+
+    def take_errors(self) -> List[str]:
+        """Failures recorded since the last call; a failed operation leaves its state unchanged"""
+        with self._lock:
+            errors, self.errors = self.errors, []
+        return errors
+
+    def render(self, input_file: str, operations: List[Dict[str, Any]],
+               quality: Optional[str] = None) -> str:
+        """Render synchronously on the calling thread, returns the output file.
+
+        Safe to call from several threads at once, e.g. to render alternatives
+        side by side while the processing thread is busy.
+        """
+        quality = quality or self.quality
+        cache_key = self._cache_key(input_file, operations, quality)
+        with self._lock:
+            cached_file = self.render_cache.get(cache_key) if cache_key else None
+        if cached_file and os.path.exists(cached_file):
+            return cached_file
+        output_file = self.store.new_path()
+        self._render_to_file(input_file, output_file, operations, quality, show_progress=False)
+        return output_file
+
+    def _tracked(self, frames: int, sr: int, operations: List[Dict[str, Any]], quality: str,
+                 show_progress: bool, render: Callable[[Callable[[], None]], Any]) -> Any:
+        """Run a render with a progress reporter and feed its timing to the cost model.
+
+        render() gets a callback to call when the work actually starts, so time
+        spent waiting for a free worker is not counted as render time.
+        """
+        duration = frames / sr
+        enhance = QUALITY_PROFILES[quality]['enhance']
+        reporter = ProgressReporter(self.cost_model.estimates(operations, duration, quality, enhance),
+                                    stems=any(op.get('stem') for op in operations), show=show_progress)
+        progress.set_reporter(reporter)
+        timing = {'start': perf_counter()}
+
+        def started() -> None:
+            timing['start'] = perf_counter()
+
+        try:
+            result = render(started)
+        finally:
+            progress.set_reporter(None)
+            reporter.finish()
+        self.cost_model.record(operations, duration, quality, enhance, perf_counter() - timing['start'])
+        return result
+
+    def _render_to_file(self, input_file: str, output_file: str,
+                        operations: List[Dict[str, Any]], quality: str, show_progress: bool = True) -> None:
+        self.store.touch(input_file)
+        stem_files = (self._stem_files(input_file, QUALITY_PROFILES[quality])
+                      if any(op.get('stem') for op in operations) else None)
+
+        if self.worker is not None and is_pcm(input_file) and is_pcm(output_file):
+            # The worker maps the input and writes the output itself, so no samples pass through here
+            frames, sr, _, _ = pcm_info(input_file)
+
+            def render(started: Callable[[], None]):
+                beats, errors = self.worker.render_file(input_file, output_file, operations, quality,
+                                                        stem_files, on_start=started)
+                self._worker_rendered(output_file, beats, errors)
+                self.store.adopt(output_file)
+        else:
+            y, sr = load_audio(input_file)
+            frames = len(y)
+
+            def render(started: Callable[[], None]):
+                if self.worker is not None:
+                    _, beats, errors = self.worker.render(y, sr, operations, quality,
+                                                          lambda audio: self.store.write(audio, sr, output_file),
+                                                          stem_files, on_start=started)
+                    self._worker_rendered(output_file, beats, errors)
+                else:
+                    modified_audio = self._render(y, sr, operations, QUALITY_PROFILES[quality], stem_files)
+                    self.store.write(modified_audio, sr, output_file)
+
+        self._tracked(frames, sr, operations, quality, show_progress, render)
+        for stem_file in stem_files or ():
+            self.store.adopt(stem_file)
+
+        cache_key = self._cache_key(input_file, operations, quality)
+        if cache_key:
+            with self._lock:
+                self.render_cache[cache_key] = output_file
+
+    def _worker_rendered(self, output_file: str, beats: np.ndarray, errors: List[str]) -> None:
+        """Keep what the worker sent back with a render: the output's beat grid and skipped operations"""
+        for error in errors:
+            self._record_error(error)
+        with self._lock:
+            self.beat_grids[output_file] = beats
+
+    def _render(self, y: np.ndarray, sr: int, operations: List[Dict[str, Any]],
+                profile: Dict[str, Any], stem_files: Optional[Tuple[str, str]] = None) -> np.ndarray:
+        if operations and operations[0].get('stem'):
+            return self._render_stem(y, sr, operations, profile, stem_files)
+        region = operations[0].get('region') if operations else None
+        if region:
+            return self._render_region(y, sr, operations, region, profile)
+
+        # Apply the requested effects
+        modified_audio = self._apply_operations(y, sr, operations, profile)
+
+        # Post-processing for quality improvement
+        if profile['enhance']:
+            progress.begin_operation('enhance')
+            modified_audio = self._enhance_audio_quality(modified_audio, y, sr, profile)
+        return as_audio(modified_audio)
+
+    def _apply_operations(self, y: np.ndarray, sr: int, operations: List[Dict[str, Any]],
+                          profile: Dict[str, Any], beat_samples: Optional[np.ndarray] = None):
+        """Apply operations in order without ever writing to y.
+
+        Beat effects materialize into a buffer an earlier operation of this
+        render produced and the chain has moved past, so a run of them takes
+        turns on two buffers instead of allocating a track per operation.
+        beat_samples, if given, is y's beat grid in samples for the beat effects;
+        it holds until an operation changes the timeline.
+        """
+        audio, spare = y, None
+        for i, operation in enumerate(operations):
+            progress.begin_operation(i)
+            out = spare if operation['type'] in EDIT_LIST_OPERATIONS else None
+            result = self._apply_effect(audio, sr, operation, profile, out=out, beat_samples=beat_samples)
+            if operation['type'] in STRETCH_OPERATIONS:
+                beat_samples = None
+            # Effects may hand back their input or a view of it, e.g. a stretch by 1
+            reusable = (audio is not y and type(audio) is np.ndarray
+                        and not (isinstance(result, np.ndarray) and np.may_share_memory(result, audio)))
+            spare = audio if reusable else None
+            audio = result
+        return audio
+
+    def render_audio(self, y: np.ndarray, sr: int, operations: List[Dict[str, Any]],
+                     quality: Optional[str] = None) -> np.ndarray:
+        """Render in memory, for callers that keep their own intermediates"""
+        quality = quality or self.quality
+        if self.worker is not None:
+            def render(started: Callable[[], None]) -> np.ndarray:
+                audio, _, errors = self.worker.render(y, sr, operations, quality, np.array, on_start=started)
+                for error in errors:
+                    self._record_error(error)
+                return audio
+        else:
+            def render(started: Callable[[], None]) -> np.ndarray:
+                return self._render(y, sr, operations, QUALITY_PROFILES[quality])
+        return self._tracked(len(y), sr, operations, quality, True, render)
+
+    def beat_grid(self, y: np.ndarray, sr: int) -> np.ndarray:
+        """Beat positions of mono samples in samples, tracked in the worker when there is one"""
+        if self.worker is not None:
+            return self.worker.beat_grid(y, sr)
+        return AudioEffects.beat_samples(y, sr)
+
+    def warm_up(self, sr: int, quality: Optional[str] = None) -> None:
+        """Compile the render kernels in whichever process will render"""
+        res_type = QUALITY_PROFILES[quality or self.quality]['res_type']
+        if self.worker is not None:
+            self.worker.warm_up(sr, res_type)
+        else:
+            start_warmup(sr, res_type)
+
+    def close(self) -> None:
+        """Stop the processing thread once queued renders are done, and the workers"""
+        self.processing_queue.put(None)
+        if self.worker is not None:
+            self.worker.close()
+
+    @staticmethod
+    def _stem_files(state_file: str, profile: Dict[str, Any]) -> Optional[Tuple[str, str]]:
+        """Where the harmonic/percussive split of a state is kept, next to the state itself.
+
+        The split depends on the STFT it was made with, so each n_fft/hop gets its own files.
+        """
+        if not is_pcm(state_file):
+            return None
+        base = state_file[:-len(PCM_EXTENSION)]
+        stft = f"{profile['n_fft']}-{profile['hop_length']}"
+        return (f"{base}.harmonic.{stft}{PCM_EXTENSION}",
+                f"{base}.percussive.{stft}{PCM_EXTENSION}")
+
+    def _stems(self, y: np.ndarray, sr: int, profile: Dict[str, Any],
+               stem_files: Optional[Tuple[str, str]]) -> Tuple[np.ndarray, np.ndarray]:
+        """The state's split, memory-mapped when it was computed before"""
+        if stem_files and all(os.path.exists(f) for f in stem_files):
+            try:
+                harmonic, _ = read_pcm(stem_files[0])
+                percussive, _ = read_pcm(stem_files[1])
+                if len(harmonic) == len(y) and len(percussive) == len(y):
+                    return harmonic, percussive
+            except Exception as e:
+                print(f"Warning: Could not read cached stems: {str(e)}")
+
+        harmonic, percussive = AudioEffects.hpss(y, n_fft=profile['n_fft'], hop_length=profile['hop_length'])
+        for stem_file, stem in zip(stem_files or (), (harmonic, percussive)):
+            # Written aside under a unique name and moved, so a concurrent render
+            # never maps half a file or interleaves its writes with ours
+            fd, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=os.path.dirname(stem_file))
+            os.close(fd)
+            try:
+                write_pcm(tmp_path, stem, sr)
+                os.replace(tmp_path, stem_file)
+            except OSError:
+                os.remove(tmp_path)
+                raise
+        return harmonic, percussive
+
+    def _render_stem(self, y: np.ndarray, sr: int, operations: List[Dict[str, Any]],
+                     profile: Dict[str, Any], stem_files: Optional[Tuple[str, str]]) -> np.ndarray:
+        """Apply one operation to one stem and mix the other stem back in"""
+        operation = dict(operations[0])
+        stem = operation.pop('stem')
+        progress.begin_operation('stems')
+        harmonic, percussive = self._stems(y, sr, profile, stem_files)
+        target, rest = (harmonic, percussive) if stem == 'harmonic' else (percussive, harmonic)
+
+        modified = self._render(target, sr, [operation] + operations[1:], dict(profile, enhance=False))
+        modified = librosa.util.fix_length(modified, size=len(rest)) + rest
+        if profile['enhance']:
+            progress.begin_operation('enhance')
+            modified = self._enhance_audio_quality(modified, y, sr, profile)
+        return as_audio(modified)
+
+    def _source_audio(self, file_path: str, sr: int) -> np.ndarray:
+        key = (file_path, sr)
+        with self._lock:
+            audio = self._sources.get(key)
+        if audio is None:
+            audio, _ = load_audio(file_path, sr=sr)
+            with self._lock:
+                # Only the most recent source is kept around
+                self._sources = {key: audio}
+        return audio
+
+    def _region_bounds(self, y: np.ndarray, sr: int, region: Dict[str, Any],
+                       profile: Dict[str, Any]) -> Tuple[int, int]:
+        """Sample range of a region; bars and beats are 1-based and inclusive"""
+        if region['unit'] == 's':
+            start, end = int(region['start'] * sr), int(region['end'] * sr)
+        else:
+            _, beat_frames = AudioEffects.beat_track(y, sr, profile['beat_hop_length'])
+            beats = librosa.frames_to_samples(beat_frames)
+            per_unit = 4 if region['unit'] == 'bar' else 1
+            first = (int(region['start']) - 1) * per_unit
+            last = int(region['end']) * per_unit
+            if len(beats) == 0 or first >= len(beats):
+                raise ValueError(f"Region {region} is outside the track's beat grid")
+            start = int(beats[max(first, 0)])
+            end = int(beats[last]) if last < len(beats) else len(y)
+        start = min(max(start, 0), len(y))
+        end = min(max(end, start), len(y))
+        if end - start == 0:
+            raise ValueError(f"Region {region} is empty")
+        return start, end
+
+    def _render_region(self, y: np.ndarray, sr: int, operations: List[Dict[str, Any]],
+                       region: Dict[str, Any], profile: Dict[str, Any]) -> np.ndarray:
+        """Render only the region plus some context and splice it back with crossfades"""
+        start, end = self._region_bounds(y, sr, region, profile)
+        context = int(REGION_CONTEXT_SECONDS * sr)
+        lo, hi = max(0, start - context), min(len(y), end + context)
+        segment = y[lo:hi]
+        # Beat effects cut on the state's own grid, so the pattern starts on the
+        # region's first beat instead of wherever a tracker on the excerpt begins
+        beats = AudioEffects.beat_samples(y, sr, profile['beat_hop_length'])
+        region_beats = beats[(beats >= start) & (beats <= end)] - lo
+
+        modified = self._apply_operations(segment, sr, operations, profile, region_beats)
+        if profile['enhance']:
+            progress.begin_operation('enhance')
+            modified = self._enhance_audio_quality(modified, y[lo:hi], sr, profile)
+        modified = as_audio(modified)
+
+        if any(op['type'] in STRETCH_OPERATIONS for op in operations):
+            scale = len(modified) / len(segment)
+        else:
+            scale = 1.0
+            modified = librosa.util.fix_length(modified, size=len(segment))
+        new_start = int(round((start - lo) * scale))
+        new_end = min(new_start + int(round((end - start) * scale)), len(modified))
+
+        output = np.concatenate([y[:start], modified[new_start:new_end], y[end:]])
+        splice_end = start + (new_end - new_start)
+
+        # Crossfade into the region through the rendered context on either side
+        fade = min(REGION_CROSSFADE, new_start, start)
+        if fade > 0:
+            fade_in = np.linspace(0, 1, fade)
+            output[start - fade:start] = (y[start - fade:start] * (1 - fade_in)
+                                          + modified[new_start - fade:new_start] * fade_in)
+        fade = min(REGION_CROSSFADE, len(modified) - new_end, len(y) - end)
+        if fade > 0:
+            fade_in = np.linspace(0, 1, fade)
+            output[splice_end:splice_end + fade] = (modified[new_end:new_end + fade] * (1 - fade_in)
+                                                    + y[end:end + fade] * fade_in)
+        return output
+
+    def _enhance_audio_quality(self, modified_audio: np.ndarray, original_audio: np.ndarray, sr: int,
+                               profile: Dict[str, Any]) -> np.ndarray:
         """
         Enhance the audio quality through multiple stages of processing
         """
@@ -230,7 +757,7 @@ class AudioProcessor:
                 (2000, 8000)  # Highs
             ]
             modified_audio = AudioEffects.spectral_gate(
-                modified_audio, 
+                as_spectral(modified_audio, profile['n_fft'], profile['hop_length']), 
                 sr, 
                 threshold_db=-50,
                 preserve_freq_ranges=preserved_ranges
@@ -245,7 +772,7 @@ class AudioProcessor:
 
             # 3. Normalize loudness to match original
             modified_audio = AudioEffects.match_loudness(
-                modified_audio,
+                as_audio(modified_audio),
                 original_audio,
                 sr
             )
@@ -260,42 +787,67 @@ class AudioProcessor:
         except Exception as e:
             print(f"Warning: Audio quality enhancement failed: {str(e)}")
             print("Falling back to original modified audio")
-            return modified_audio
+            return as_audio(modified_audio)
 
-    def _apply_effect(self, audio, sr, operation):
+    def _apply_effect(self, audio, sr, operation, profile, out=None, beat_samples=None):
         effect_type = operation['type']
         values = operation['values']
+        res_type = profile['res_type']
+        n_fft, hop_length = profile['n_fft'], profile['hop_length']
+        beat_hop = profile['beat_hop_length']
+
+        # Spectral operations hand their STFT on; everything else needs samples
+        engine = stretch_engine(operation)
+        if not is_spectral(operation):
+            audio = as_audio(audio)
 
         try:
             if effect_type == 'rt' and len(values) >= 1:
-                return AudioEffects.resample_time(audio, sr, rate=float(values[0]))
+                return AudioEffects.resample_time(audio, sr, rate=float(values[0]), res_type=res_type)
             elif effect_type == 'a' and len(values) >= 1:
-                return AudioEffects.resample_time(audio, sr, rate=float(values[0]))
+                return AudioEffects.resample_time(audio, sr, rate=float(values[0]), res_type=res_type)
             elif effect_type == 't' and len(values) >= 1:
-                return AudioEffects.time_stretch(audio, rate=float(values[0]))
+                if engine == 'wsola':
+                    return AudioEffects.wsola_stretch(audio, sr, rate=float(values[0]), hop_length=beat_hop)
+                return AudioEffects.time_stretch(as_spectral(audio, n_fft, hop_length), rate=float(values[0]))
             elif effect_type == 'p' and len(values) >= 1:
-                return AudioEffects.pitch_shift(audio, sr, n_steps=float(values[0]))
+                return AudioEffects.pitch_shift(audio, sr, n_steps=float(values[0]), spectral=True,
+                                                res_type=res_type, n_fft=n_fft, hop_length=hop_length)
             elif effect_type == 'bpm' and len(values) >= 1:
                 target_bpm = float(values[0])
                 if target_bpm < 20:  # Set a minimum BPM threshold
                     print(f"Warning: BPM value {target_bpm} is too low. Setting to minimum of 20 BPM.")
                     target_bpm = 20
                 source_bpm = AudioEffects.estimate_bpm(audio, sr)
-                return AudioEffects.match_bpm(audio, sr, source_bpm, target_bpm)
+                if engine == 'wsola':
+                    return AudioEffects.match_bpm(audio, sr, source_bpm, target_bpm, engine=engine, hop_length=beat_hop)
+                return AudioEffects.match_bpm(as_spectral(audio, n_fft, hop_length), sr, source_bpm, target_bpm)
             elif effect_type == 'stut' and len(values) >= 4:
-                return AudioEffects.add_stutter(audio, sr, beats=int(values[0]), count=int(values[1]), length=float(values[2]), repeat=int(values[3]))
+                return AudioEffects.add_stutter(audio, sr, beats=int(values[0]), count=int(values[1]), length=float(values[2]), repeat=int(values[3]), hop_length=beat_hop, beat_samples=beat_samples, out=out)
             elif effect_type == 'chop' and len(values) >= 4:
-                return AudioEffects.chop_and_rearrange(audio, sr, beats=int(values[0]), size=int(values[1]), step=int(values[2]), repeat=int(values[3]))
+                return AudioEffects.chop_and_rearrange(audio, sr, beats=int(values[0]), size=int(values[1]), step=int(values[2]), repeat=int(values[3]), hop_length=beat_hop, beat_samples=beat_samples, out=out)
             elif effect_type == 'echo' and len(values) >= 3:
                 return AudioEffects.add_echo(audio, sr, delay=float(values[0]), count=int(values[1]), decay=float(values[2]))
             elif effect_type == 'mash' and len(values) >= 4:
-                return AudioEffects.random_mix_beats(audio, sr, beats=int(values[0]), parts=int(values[1]), beats_per_mash=int(values[2]), repeat=int(values[3]))
+                return AudioEffects.random_mix_beats(audio, sr, beats=int(values[0]), parts=int(values[1]), beats_per_mash=int(values[2]), repeat=int(values[3]), hop_length=beat_hop, beat_samples=beat_samples, out=out)
+            elif effect_type in SOURCE_OPERATIONS and len(values) >= 3:
+                if not operation.get('source'):
+                    print(f"Warning: Load a second track with src:<path>; before using {effect_type}.")
+                    self._record_error(f"{effect_type}: no second track loaded with src:<path>;")
+                    return audio
+                source = self._source_audio(operation['source'], sr)
+                gain = float(values[3]) if len(values) >= 4 else (1.0 if effect_type == 'splice' else 0.7)
+                # Beats count from 1 on the command line, like regions
+                return AudioEffects.layer_beats(audio, sr, source, start_beat=int(values[0]) - 1, length=int(values[1]),
+                                                interval=int(values[2]), gain=gain,
+                                                replace=effect_type == 'splice', hop_length=beat_hop)
             elif effect_type == 'loop' and len(values) >= 4:
-                return AudioEffects.create_loop(audio, sr, beats=int(values[0]), interval=int(values[1]), length=int(values[2]), repeat=int(values[3]))
+                return AudioEffects.create_loop(audio, sr, beats=int(values[0]), interval=int(values[1]), length=int(values[2]), repeat=int(values[3]), hop_length=beat_hop, beat_samples=beat_samples, out=out)
             elif effect_type == 'rev' and len(values) >= 4:
-                return AudioEffects.reverse_by_beats(audio, sr, beats=int(values[0]), interval=int(values[1]), length=int(values[2]), repeat=int(values[3]))
+                return AudioEffects.reverse_by_beats(audio, sr, beats=int(values[0]), interval=int(values[1]), length=int(values[2]), repeat=int(values[3]), hop_length=beat_hop, beat_samples=beat_samples, out=out)
             else:
                 print(f"Warning: Unknown operation '{effect_type}' or insufficient parameters.")
+                self._record_error(f"{effect_type}: unknown operation or insufficient parameters {values}")
                 return audio
 
         except ValueError as ve:
@@ -303,6 +855,7 @@ class AudioProcessor:
             print(f"Details: {str(ve)}")
             print(f"Provided values: {values}")
             print("This might be due to incompatible audio length, beat settings, or incorrect parameter types.")
+            self._record_error(f"{effect_type}: invalid parameter value: {str(ve)}")
             return audio
 
         except TypeError as te:
@@ -310,6 +863,7 @@ class AudioProcessor:
             print(f"Details: {str(te)}")
             print(f"Provided values: {values}")
             print("Please check that all parameters are of the correct type (int, float, etc.).")
+            self._record_error(f"{effect_type}: incorrect parameter type: {str(te)}")
             return audio
 
         except Exception as e:
@@ -318,35 +872,111 @@ class AudioProcessor:
             print(f"Provided values: {values}")
             print("Stack trace:")
             traceback.print_exc()
+            self._record_error(f"{effect_type}: {str(e)}")
             return audio
 
 class AudioManager:
-    def __init__(self, input_file: str):
+    def __init__(self, input_file: str, temp_budget_bytes: int = 2 * 1024 ** 3,
+                 quality: str = DEFAULT_QUALITY, record_path: Optional[str] = None,
+                 render_worker: bool = True, playback: bool = True):
         self.input_file = input_file
-        self.y, self.sr = librosa.load(input_file, sr=None)
-        self.working_audio = np.copy(self.y)
+        # Replayable log of every instruction, see replay.py
+        self.recorder = SessionRecorder(record_path, input_file, quality) if record_path else None
+        self.loader = ProgressiveLoader(input_file)
+        self.sr = self.loader.sr
+        self.y = self.loader.wait_for(int(PREVIEW_SECONDS * self.sr))
+        self._loaded = threading.Event()
         self.temp_dir = tempfile.mkdtemp()
         self.history = []
         self.undo_stack = []
         self.redo_stack = []
         
         # Initialize components
-        self.player = AudioPlayer(self.sr)
-        self.processor = AudioProcessor(self.temp_dir)
+        self.store = PCMStore(self.temp_dir, budget_bytes=temp_budget_bytes)
+        self.processor = AudioProcessor(self.temp_dir, self.store, quality, use_worker=render_worker,
+                                        workers=VARIATION_WORKERS)
+        # Headless sessions (the daemon) only render, so they get no player and no beat analysis for it
+        self.player: Optional[AudioPlayer] = AudioPlayer(self.sr, analyze=self.processor.beat_grid) if playback else None
+        # Compile librosa's kernels while the user listens, not on the first command
+        self.processor.warm_up(self.sr)
         self.history = AudioHistory()
         
-        # Set up initial state
-        self.working_file = os.path.join(self.temp_dir, 'working.wav')
-        sf.write(self.working_file, self.y, self.sr)
-        self.player.load_audio(self.working_file)
+        # Alternatives rendered from the current state: (file, operations, time scale, samples, beats)
+        self.variations: List[Tuple[str, List[Dict[str, Any]], float, np.ndarray, Optional[np.ndarray]]] = []
+        self.auditioned = 0
+        self._variation_pool = ThreadPoolExecutor(max_workers=VARIATION_WORKERS)
+
+        # The operations that lead from the original to each state, editable by position
+        self.chain = OperationChain(self._render_chain_batch, self._batch_operations, CHAIN_CHECKPOINT_BYTES,
+                                    load_file=lambda file_path: read_audio(file_path)[0])
+        self.chain_states: Dict[str, List[Dict[str, Any]]] = {}
+
+        # Second track that layer/splice pull beats from
+        self.source_file: Optional[str] = None
+        
+        # Set up initial state; the working file is written once decoding finishes
+        self.working_file = os.path.join(self.temp_dir, 'working' + PCM_EXTENSION)
+        self.original_file = self.working_file
+        self.chain_states[self.original_file] = []
+        self._pin_states()
+        if self.player is not None:
+            self.player.set_audio(self.y)
         self.history.add(self.working_file, [])
         self.change_counter = 0
+        self.loader.on_complete(self._finish_loading)
+
+    def _finish_loading(self, y: np.ndarray) -> None:
+        try:
+            self.y = y
+            self.store.write(y, self.sr, self.original_file)
+            if self.player is not None:
+                self.player.extend_audio(y)
+        except Exception as e:
+            print(f"Error finishing load: {str(e)}")
+        self._loaded.set()
+
+    def wait_until_loaded(self) -> None:
+        """Block until the whole track is decoded and the original state is on disk"""
+        if self._loaded.is_set():
+            return
+        print("Waiting for the track to finish decoding...")
+        self.loader.result()
+        self._loaded.wait()
 
     def process_instructions(self, instructions: str) -> bool:
+        if self.recorder is None:
+            return self._process_instructions(instructions)
+        started = self.recorder.now()
+        try:
+            return self._process_instructions(instructions)
+        finally:
+            self.recorder.record(instructions, started, self.recorder.now() - started)
+
+    def _process_instructions(self, instructions: str) -> bool:
+        if instructions not in STREAMING_COMMANDS:
+            self.wait_until_loaded()
+
         # Handle special commands
         if len(instructions) == 2 and instructions.endswith(';'):
             command = instructions[0]
             return self._handle_special_command(command)
+        if instructions.startswith('src:'):
+            file_path, _, rest = instructions[len('src:'):].partition(';')
+            self._set_source(file_path.strip().strip('"\''))
+            return self._process_instructions(rest.strip()) if rest.strip() else True
+        if instructions.startswith('quality:'):
+            self._set_quality(instructions[len('quality:'):].strip().rstrip(';'))
+            return True
+        if '|' in instructions:
+            self._render_variations(instructions.split('|'))
+            return True
+        if instructions.startswith('v:'):
+            self._audition_variation(int(float(instructions[2:].strip().rstrip(';'))))
+            return True
+        edit = re.fullmatch(r'\s*(\d+)([=+-])(.*)', instructions, re.S)
+        if edit:
+            self._edit_chain(int(edit.group(1)), edit.group(2), edit.group(3))
+            return True
 
         # Parse and process regular instructions
         operations = self._parse_instructions(instructions)
@@ -357,6 +987,8 @@ class AudioManager:
     def _handle_special_command(self, command: str) -> bool:
         if command == 'q':
             return False
+        elif command in ('p', 'i', 'm') and self.player is None:
+            print("This session has no playback.")
         elif command == 's':
             self._save_current_state()
         elif command == 'p':
@@ -366,28 +998,172 @@ class AudioManager:
         elif command == 'r':
             self._redo()
         elif command == 'h':
-            self._print_help()
+            print_help()
         elif command == 'o':
             self._get_operations_history()
+        elif command == 'k':
+            self._commit_variation()
+        elif command == 'i':
+            print("Playback health:")
+            print(self.player.metrics.report())
+        elif command == 'm':
+            self._dump_metrics()
         return True
 
-    def _process_operations(self, operations: List[Dict[str, Any]]) -> None:
+    def _render_variations(self, alternatives: List[str]) -> None:
+        """Render alternative edits of the current state side by side"""
+        # Back to the current state first, so the playhead maps from what is really playing
+        self._drop_variations()
+        input_file = self.working_file
+        parsed = [self._parse_instructions(alternative) for alternative in alternatives]
+        parsed = [operations for operations in parsed if operations]
+
+        def render(operations: List[Dict[str, Any]]) -> Tuple[str, List[Dict[str, Any]], float, np.ndarray,
+                                                              Optional[np.ndarray]]:
+            output_file = input_file
+            time_scale = 1.0
+            for batch in self._batch_operations(operations):
+                batch_input = output_file
+                output_file = self.processor.render(batch_input, batch)
+                self._extend_chain(batch_input, output_file, batch)
+                time_scale *= self._time_scale(batch, batch_input, output_file)
+            audio, sr = read_audio(output_file)
+            # The worker sent the grid along; without one, analyse now so switching costs only the swap
+            beats = self.processor.beat_grids.get(output_file)
+            if beats is None and self.player is not None:
+                beats = self.processor.beat_grid(audio if audio.ndim == 1 else audio.mean(axis=1), sr)
+            return output_file, operations, time_scale, audio, beats
+
+        print(f"Rendering {len(parsed)} variations...")
+        variations = []
+        for i, future in enumerate([self._variation_pool.submit(render, ops) for ops in parsed], start=1):
+            try:
+                variations.append(future.result())
+            except Exception as e:
+                print(f"Variation {i} failed: {str(e)}")
+        self.variations = variations
+        self.auditioned = 0
+        self._pin_states()
+        for i, (_, operations, _, _, _) in enumerate(self.variations, start=1):
+            print(f"  v:{i}; {operations}")
+        print("Use v:<n>; to listen, v:0; for the current state, k; to keep the one playing.")
+
+    def _audition_variation(self, index: int) -> None:
+        if index < 0 or index > len(self.variations):
+            print(f"No variation {index}.")
+            return
+        # Map the playhead from what is playing now back to the base state, then forward
+        current_scale = self.variations[self.auditioned - 1][2] if self.auditioned else 1.0
+        if self.player is not None and index == 0:
+            audio, _ = read_audio(self.working_file)
+            self.player.queue_swap(audio, 1.0 / current_scale, self.processor.beat_grids.get(self.working_file))
+        elif self.player is not None:
+            _, _, time_scale, audio, beats = self.variations[index - 1]
+            self.player.queue_swap(audio, time_scale / current_scale, beats)
+        self.auditioned = index
+        print(f"Playing {'the current state' if index == 0 else f'variation {index}'}.")
+
+    def _commit_variation(self) -> None:
+        if not self.auditioned:
+            print("No variation is playing; use v:<n>; first.")
+            return
+        output_file, operations, _, _, _ = self.variations[self.auditioned - 1]
+        self.working_file = output_file
+        self.history.add(output_file, operations)
+        self.variations = []
+        self.auditioned = 0
+        self._pin_states()
+        print("Variation kept with the following operations:")
+        for op in operations:
+            print(op)
+
+    def _drop_variations(self) -> None:
+        """Variations belong to the state they were rendered from"""
+        if self.auditioned and self.player is not None:
+            audio, _ = read_audio(self.working_file)
+            self.player.queue_swap(audio, 1.0 / self.variations[self.auditioned - 1][2],
+                                   self.processor.beat_grids.get(self.working_file))
+        self.variations = []
+        self.auditioned = 0
+
+    def _set_source(self, file_path: str) -> None:
+        if not os.path.isfile(file_path):
+            print(f"Source track not found: {file_path}")
+            return
+        self.source_file = os.path.abspath(file_path)
+        print(f"Layering from: {self.source_file}")
+        try:
+            # Seeks past the intro and decodes only the excerpt, not the whole track
+            offset, duration = SOURCE_TEMPO_EXCERPT
+            excerpt, sr = load_audio(self.source_file, offset=offset, duration=duration)
+            if len(excerpt) < sr * 5:
+                excerpt, sr = load_audio(self.source_file, duration=duration)
+            print(f"Source tempo: ~{AudioEffects.estimate_bpm(excerpt, sr):.1f} BPM, layer/splice match it to this track")
+        except Exception as e:
+            print(f"Warning: Could not estimate the source tempo: {str(e)}")
+
+    def _set_quality(self, quality: str) -> None:
+        if quality not in QUALITY_PROFILES:
+            print(f"Unknown quality '{quality}'. Choose one of: {', '.join(QUALITY_PROFILES)}")
+            return
+        self.processor.quality = quality
+        self.processor.warm_up(self.sr)
+        print(f"Rendering at {quality} quality.")
+        if quality != 'final':
+            print("Saving re-renders the edit at final quality.")
+
+    def _run_operations(self, input_file: str, operations: List[Dict[str, Any]],
+                        quality: Optional[str] = None) -> Tuple[str, float]:
+        """Render operations from input_file, returns the output file and the playhead scale"""
+        result = {'file': input_file}
+
         def process_complete(output_file: str) -> None:
-            self.working_file = output_file
-            self.player.load_audio(output_file)
+            result['file'] = output_file
             print("Operation completed successfully.")
 
-        current_input = self.working_file
-        for operation in operations:
+        self._print_estimate(input_file, operations, quality)
+        time_scale = 1.0
+        for batch in self._batch_operations(operations):
+            current_input = result['file']
             operation_id = self.processor.process_audio(
                 current_input,
-                [operation],
-                process_complete
+                batch,
+                process_complete,
+                quality
             )
-            # Wait for the operation to complete
-            while operation_id in self.processor.completion_callbacks:
-                time.sleep(0.1)
-            current_input = self.working_file
+            self.processor.wait(operation_id)
+            if result['file'] != current_input:
+                self._extend_chain(current_input, result['file'], batch, quality)
+            time_scale *= self._time_scale(batch, current_input, result['file'])
+        return result['file'], time_scale
+
+    def _print_estimate(self, input_file: str, operations: List[Dict[str, Any]],
+                        quality: Optional[str] = None) -> None:
+        """Say up front how long a render will take, and warn when that is long"""
+        quality = quality or self.processor.quality
+        enhance = QUALITY_PROFILES[quality]['enhance']
+        try:
+            duration = audio_frames(input_file) / self.sr
+        except Exception:
+            return
+        estimate = sum(self.processor.cost_model.estimate(batch, duration, quality, enhance)
+                       for batch in self._batch_operations(operations))
+        if estimate >= EXPENSIVE_RENDER_SECONDS:
+            print(f"Warning: This will take about {estimate:.0f}s to render.")
+            if quality != 'draft':
+                print("quality:draft; renders much faster while you experiment.")
+        elif estimate >= 3.0:
+            print(f"Estimated render time: ~{estimate:.0f}s")
+
+    def _process_operations(self, operations: List[Dict[str, Any]]) -> None:
+        self._drop_variations()
+        start_file = self.working_file
+        self.working_file, time_scale = self._run_operations(start_file, operations)
+
+        # Switch playback once, mapping the playhead through the whole chain
+        self._pin_states()
+        if self.working_file != start_file:
+            self._queue_audio(self.working_file, time_scale)
 
         # After all operations are complete, update history
         self.history.add(self.working_file, operations)
@@ -395,9 +1171,79 @@ class AudioManager:
         for op in operations:
             print(op)
 
+    def _render_chain_batch(self, audio: np.ndarray, operations: List[Dict[str, Any]],
+                            quality: str) -> np.ndarray:
+        return self.processor.render_audio(audio, self.sr, operations, quality)
+
+    def _extend_chain(self, start_file: str, output_file: str, operations: List[Dict[str, Any]],
+                      quality: Optional[str] = None) -> None:
+        """Record the chain of a state rendered from start_file and checkpoint it by its file.
+
+        Called for every rendered batch, so each step of a long command can be
+        edited without re-rendering the steps before it.
+        """
+        steps = self.chain_states.get(start_file)
+        if steps is None:
+            return
+        steps = steps + operations
+        self.chain_states[output_file] = steps
+        self.chain.checkpoint_file(steps, quality or self.processor.quality, output_file)
+
+    def _edit_chain(self, index: int, mode: str, instructions: str) -> None:
+        """Replace (=), insert after (+) or remove (-) operation <index> and re-render from there"""
+        steps = self.chain_states.get(self.working_file)
+        if steps is None:
+            print("The operations of this state are not known, so it cannot be edited.")
+            return
+        lowest = 0 if mode == '+' else 1
+        if not lowest <= index <= len(steps):
+            print(f"No operation {index}; the chain has {len(steps)} operations (see o;).")
+            return
+        operations = [] if mode == '-' else self._parse_instructions(instructions)
+        if mode != '-' and not operations:
+            print("Nothing to insert.")
+            return
+
+        if mode == '=':
+            first, new_steps = index - 1, steps[:index - 1] + operations + steps[index:]
+        elif mode == '+':
+            first, new_steps = index, steps[:index] + operations + steps[index:]
+        else:
+            first, new_steps = index - 1, steps[:index - 1] + steps[index:]
+
+        self._drop_variations()
+        quality = self.processor.quality
+        done, _ = self.chain.latest(new_steps, quality)
+        self._print_estimate(self.original_file, new_steps[done:], quality)
+        audio = self.chain.render(self.y, new_steps, quality)
+        start_file = self.working_file
+        output_file = self.store.write(audio, self.sr)
+        self.chain_states[output_file] = new_steps
+        self.working_file = output_file
+        self._pin_states()
+        time_scale = self._time_scale(steps[first:] + new_steps[first:], start_file, output_file)
+        self._queue_audio(output_file, time_scale)
+        self.history.add(output_file, new_steps or steps)
+        print(f"Chain re-rendered from operation {first + 1}:")
+        self._print_chain(new_steps)
+
+    def _queue_audio(self, file_path: str, time_scale: float) -> None:
+        """Switch playback to a state, with the beat grid its render sent back if there is one"""
+        if self.player is not None:
+            self.player.queue_audio(file_path, time_scale, self.processor.beat_grids.get(file_path))
+
+    def _print_chain(self, steps: List[Dict[str, Any]]) -> None:
+        for i, op in enumerate(steps, start=1):
+            print(f"  {i}: {op}")
+
     def cleanup(self) -> None:
         try:
-            self.player.pause_playback()
+            if self.player is not None:
+                self.player.pause_playback()
+            self._variation_pool.shutdown(wait=False)
+            if self.recorder is not None:
+                self.recorder.close()
+            self.processor.close()
             shutil.rmtree(self.temp_dir)
         except Exception as e:
             print(f"Error cleaning up: {str(e)}")
@@ -406,26 +1252,106 @@ class AudioManager:
         operations = []
         for instruction in instructions.split(';'):
             if instruction.strip():
+                instruction, _, region = instruction.partition('@')
+                instruction, _, stem = instruction.partition('~')
                 parts = instruction.split(':')
                 effect_type = parts[0]
                 values = [float(v) for v in parts[1:]]
-                operations.append({'type': effect_type, 'values': values})
+                operation = {'type': effect_type, 'values': values}
+                if stem:
+                    self._set_stem(operation, stem.strip())
+                if effect_type in SOURCE_OPERATIONS:
+                    operation['source'] = self.source_file
+                if region:
+                    operation['region'] = self._parse_region(region)
+                operations.append(operation)
         return operations
 
+    def _set_stem(self, operation: Dict[str, Any], stem: str) -> None:
+        if stem not in STEM_SUFFIXES:
+            raise ValueError(f"Invalid stem '~{stem}', use ~h for harmonic or ~p for percussive")
+        if operation['type'] in STRETCH_OPERATIONS | {'rt', 'a'}:
+            print(f"Warning: {operation['type']} changes the timeline, so it is applied to the full mix.")
+            return
+        operation['stem'] = STEM_SUFFIXES[stem]
+
+    def _parse_region(self, region: str) -> Dict[str, Any]:
+        """Parse "<start>-<end>[b|s]": bars by default, beats with b, seconds with s"""
+        match = re.fullmatch(r'\s*([\d.]+)-([\d.]+)([bs]?)\s*', region)
+        if not match:
+            raise ValueError(f"Invalid region '{region}', expected e.g. @17-32, @65-128b or @30-45s")
+        start, end, unit = match.groups()
+        return {'start': float(start), 'end': float(end), 'unit': REGION_UNITS[unit]}
+
+    def _batch_operations(self, operations: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+        """Group consecutive spectral operations so they render in one pass.
+
+        Consecutive beat effects on the same region and stem are grouped too,
+        so from the third one on they write into the buffers of earlier ones.
+        """
+        batches: List[List[Dict[str, Any]]] = []
+        for operation in operations:
+            previous = batches[-1][-1] if batches else None
+            if previous is None or operation.get('region') != previous.get('region'):
+                batches.append([operation])
+            elif is_spectral(operation) and is_spectral(previous):
+                batches[-1].append(operation)
+            elif (operation['type'] in EDIT_LIST_OPERATIONS and previous['type'] in EDIT_LIST_OPERATIONS
+                  and operation.get('stem') == previous.get('stem')):
+                batches[-1].append(operation)
+            else:
+                batches.append([operation])
+        return batches
+
+    def _time_scale(self, operations: List[Dict[str, Any]], old_file: str, new_file: str) -> float:
+        """How positions in old_file map into new_file after the given operations"""
+        if not any(op['type'] in STRETCH_OPERATIONS and not op.get('region') for op in operations):
+            return 1.0
+        try:
+            return audio_frames(new_file) / max(audio_frames(old_file), 1)
+        except Exception:
+            return 1.0
+
+    def _pin_states(self) -> None:
+        """Keep the original and the current state out of reach of the temp budget"""
+        self.store.pin([self.original_file, self.working_file]
+                       + [variation[0] for variation in self.variations])
+
+    def _state_available(self, file_path: str) -> bool:
+        if os.path.exists(file_path):
+            return True
+        print("That state was dropped to stay within the temp storage budget.")
+        return False
+
     def _undo(self) -> None:
+        self._drop_variations()
+        undone = self.history.current()
         previous_state = self.history.undo()
         if previous_state:
             file_path, operations = previous_state
-            self.player.load_audio(file_path)
+            if not self._state_available(file_path):
+                self.history.redo()
+                return
+            time_scale = self._time_scale(undone[1], self.working_file, file_path)
+            self.working_file = file_path
+            self._pin_states()
+            self._queue_audio(file_path, time_scale)
             print("Undo successful.")
         else:
             print("No more undos available.")
 
     def _redo(self) -> None:
+        self._drop_variations()
         next_state = self.history.redo()
         if next_state:
             file_path, operations = next_state
-            self.player.load_audio(file_path)
+            if not self._state_available(file_path):
+                self.history.undo()
+                return
+            time_scale = self._time_scale(operations, self.working_file, file_path)
+            self.working_file = file_path
+            self._pin_states()
+            self._queue_audio(file_path, time_scale)
             print("Redo successful.")
         else:
             print("No more redos available.")
@@ -446,7 +1372,12 @@ class AudioManager:
         # Save WAV file
         wav_file_name = f"processed_{self.change_counter}_{sanitized_name}.wav"
         wav_file_path = os.path.join(processed_folder, wav_file_name)
-        shutil.copy2(self.working_file, wav_file_path)
+        source_file = self.working_file
+        if self.processor.quality != 'final':
+            print("Re-rendering the edit at final quality...")
+            source_file = self._render_history('final')
+        audio, sr = read_audio(source_file)
+        sf.write(wav_file_path, audio, sr)
         print(f"Current state saved as WAV: {wav_file_path}")
 
         # Save MP3 file
@@ -461,25 +1392,59 @@ class AudioManager:
         # Increment the change counter after saving
         self.change_counter += 1
 
+    def _render_history(self, quality: str) -> str:
+        """Replay the operations that led to the current state from the original"""
+        steps = self.chain_states.get(self.working_file)
+        if steps is not None:
+            return self._run_operations(self.original_file, steps, quality)[0] if steps else self.original_file
+        output_file = self.original_file
+        for operations in self.history.get_operations_history():
+            if operations:
+                output_file, _ = self._run_operations(output_file, operations, quality)
+        return output_file
+
+    def _dump_metrics(self) -> None:
+        script_dir = os.path.dirname(os.path.abspath(__file__))
+        processed_folder = os.path.join(script_dir, "processed")
+        os.makedirs(processed_folder, exist_ok=True)
+        file_name = f"playback_metrics_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+        file_path = os.path.join(processed_folder, file_name)
+        self.player.metrics.dump(file_path)
+        print(f"Playback metrics saved as: {file_path}")
+
     def _get_operations_history(self):
         operations_history = self.history.get_operations_history()
         print("Operations History:")
         for ops in operations_history:
             print(ops)
+        steps = self.chain_states.get(self.working_file)
+        if steps:
+            print("Chain (edit with <n>=<cmds>, <n>+<cmds> or <n>-;):")
+            self._print_chain(steps)
 
 def print_help():
     print("\nAvailable Commands:")
     print("  p:<n_steps>          - Pitch shift by n_steps semitones")
     print("  rt:<rate>            - Resample time stretch by rate")
-    print("  t:<rate>             - Time stretch by rate")
+    print("  t:<rate>[:1]         - Time stretch by rate (:1 uses the beat-aware WSOLA engine)")
     print("  stut:<count>:<length>:<repeat> - Add stutter effect")
     print("  chop:<size>:<step>:<repeat>    - Chop and rearrange")
     print("  echo:<delay>:<count>:<decay>   - Add echo effect")
     print("  mash:<parts>:<beats_per_mash>:<repeat> - Random mix beats")
     print("  loop:<interval>:<length>:<repeat> - Create loop effect")
     print("  rev:<interval>:<length>:<repeat> - Reverse by beats")
-    print("  bpm:<target_bpm>     - Match BPM to target")
+    print("  bpm:<target_bpm>[:1] - Match BPM to target (:1 uses the beat-aware WSOLA engine)")
+    print("  src:<path>           - Load a second track to take beats from")
+    print("  layer:<from_beat>:<beats>:<every>[:<gain>] - Layer beats of the second track, tempo matched (beat 1 is the first)")
+    print("  splice:<from_beat>:<beats>:<every>[:<gain>] - Replace beats with the second track's")
     print("  a:<rate>             - Resample time stretch by rate")
+    print("  <command>~h / ~p     - Apply a command to the harmonic or percussive part only (stut:1:3:1:1~p)")
+    print("  <command>@<from>-<to> - Only edit bars from-to (@17-32), beats (@65-128b) or seconds (@30-45s)")
+    print("  quality:<profile>    - Render at draft, standard or final quality")
+    print("  <n>=<cmds>           - Replace operation n of the chain (o; lists them) and re-render from there")
+    print("  <n>+<cmds>           - Insert operations after operation n (0 for the start)")
+    print("  <n>-;                - Remove operation n")
+    print("  <cmds>|<cmds>|...    - Render variations side by side; v:<n>; to listen, k; to keep one")
     print("  help;                - Show this help message")
     
     print("\nExamples of Usage:")
@@ -487,6 +1452,8 @@ def print_help():
     print("  python cli.py 'audio.mp3' 'audio.mp3' 'loop:1:4:2;echo:0.5:3:0.7;'")
     print("  python cli.py 'audio.mp3' 'audio.mp3' 'rev:2:2:2;stut:1:3:1;'")
     print("  python cli.py 'audio.mp3' 'audio.mp3' 'bpm:120;t:0.8;'")
+    print("  python cli.py 'audio.mp3' 'audio.mp3' 'stut:1:3:1:1@17-32;'")
+    print("  loop:1:4:2;|loop:1:6:2;|stut:1:3:1:1;")
     print("  python cli.py 'audio.mp3' 'audio.mp3' 'help;'")
     print("\nNote: All instructions must end with a semicolon (;)\n")
 
@@ -0,0 +1,106 @@
+from typing import List, Dict, Any, Tuple, Optional, Callable, Union
+import json
+import threading
+from collections import OrderedDict
+import numpy as np
+
+Operation = Dict[str, Any]
+
+class OperationChain:
+    """Renders operation lists from their longest checkpointed prefix.
+
+    A checkpoint holds the samples after the first n operations of a chain,
+    keyed by those operations and the render quality. Changing operation k of
+    a chain therefore only re-renders from the last checkpoint before k, and
+    undoing or redoing to a chain that was rendered before costs nothing.
+    Samples are kept in memory, or referenced by the file they were rendered
+    to and read back with load_file. Least recently used in-memory checkpoints
+    are evicted to stay under the byte budget; file checkpoints cost nothing
+    and are dropped once their file is gone.
+    """
+    def __init__(self, render_batch: Callable[[np.ndarray, List[Operation], str], np.ndarray],
+                 batch_operations: Callable[[List[Operation]], List[List[Operation]]],
+                 budget_bytes: int = 512 * 1024 ** 2,
+                 load_file: Optional[Callable[[str], np.ndarray]] = None):
+        self.render_batch = render_batch
+        self.batch_operations = batch_operations
+        self.budget_bytes = budget_bytes
+        self.load_file = load_file
+        self._checkpoints: "OrderedDict[Tuple[str, ...], Union[np.ndarray, str]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(operations: List[Operation], quality: str) -> Tuple[str, ...]:
+        return (quality,) + tuple(json.dumps(op, sort_keys=True) for op in operations)
+
+    @property
+    def used_bytes(self) -> int:
+        with self._lock:
+            return self._bytes
+
+    def checkpoint(self, operations: List[Operation], quality: str, audio: np.ndarray) -> None:
+        if not operations or audio.nbytes > self.budget_bytes:
+            return
+        key = self.key(operations, quality)
+        audio = np.array(audio, dtype='float32')
+        audio.flags.writeable = False
+        with self._lock:
+            self._remove(key)
+            self._checkpoints[key] = audio
+            self._bytes += audio.nbytes
+            for old_key in [k for k, v in self._checkpoints.items() if not isinstance(v, str)]:
+                if self._bytes <= self.budget_bytes:
+                    break
+                self._remove(old_key)
+
+    def checkpoint_file(self, operations: List[Operation], quality: str, file_path: str) -> None:
+        """Checkpoint samples that are already on disk by their path"""
+        if not operations or self.load_file is None:
+            return
+        key = self.key(operations, quality)
+        with self._lock:
+            self._remove(key)
+            self._checkpoints[key] = file_path
+
+    def _remove(self, key: Tuple[str, ...]) -> None:
+        old = self._checkpoints.pop(key, None)
+        if old is not None and not isinstance(old, str):
+            self._bytes -= old.nbytes
+
+    def latest(self, operations: List[Operation], quality: str) -> Tuple[int, Optional[np.ndarray]]:
+        """Length of the longest checkpointed prefix and its samples"""
+        for n in range(len(operations), 0, -1):
+            key = self.key(operations[:n], quality)
+            with self._lock:
+                audio = self._checkpoints.get(key)
+                if audio is not None:
+                    self._checkpoints.move_to_end(key)
+            if isinstance(audio, str):
+                try:
+                    audio = self.load_file(audio)
+                except Exception:
+                    # Dropped by the temp storage budget
+                    with self._lock:
+                        self._remove(key)
+                    continue
+            if audio is not None:
+                return n, audio
+        return 0, None
+
+    def render(self, base: np.ndarray, operations: List[Operation], quality: str) -> np.ndarray:
+        done, audio = self.latest(operations, quality)
+        if audio is None:
+            audio = base
+        if done < len(operations):
+            print(f"Re-rendering operations {done + 1}-{len(operations)} of {len(operations)}...")
+        for batch in self.batch_operations(operations[done:]):
+            audio = self.render_batch(audio, batch, quality)
+            done += len(batch)
+            self.checkpoint(operations[:done], quality, audio)
+        return audio
+
+    def clear(self) -> None:
+        with self._lock:
+            self._checkpoints.clear()
+            self._bytes = 0
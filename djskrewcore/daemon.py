@@ -0,0 +1,266 @@
+from typing import Optional, Dict, Any, Tuple
+import os
+import json
+import socket
+import argparse
+import tempfile
+import threading
+import socketserver
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+import soundfile as sf
+from djskrewcore.audio import AudioManager
+from djskrewcore.pcmstore import read_audio
+
+DEFAULT_SOCKET_PATH = "/tmp/djskrewdriver.sock"
+
+# Where renders go when a request has no save path; clients own these files
+DEFAULT_OUTPUT_DIR = os.path.join(tempfile.gettempdir(), "djskrewdriver-renders")
+
+# Special commands that only make sense for an interactive session
+REJECTED_COMMANDS = {'q;', 'p;'}
+
+class RenderSession:
+    def __init__(self, track: str):
+        self.track = track
+        # No playback to protect or feed here, and the daemon already renders on its own pool
+        self.manager = AudioManager(track, render_worker=False, playback=False)
+        self.manager.wait_until_loaded()
+        self.lock = threading.Lock()
+        self.closed = False
+
+    def close(self) -> None:
+        """Clean up once the request rendering on this session, if any, is done"""
+        with self.lock:
+            self.closed = True
+            self.manager.cleanup()
+
+class RenderDaemon:
+    """Keeps warm AudioManager sessions keyed by track and renders requests on a worker pool.
+
+    A request is a dict with:
+      track         path of the audio file to edit
+      instructions  the usual "cmd:v1:v2;" string
+      keep          continue from the session's current state instead of the original
+      save          optional path the rendered WAV is written to, otherwise a new
+                    WAV in output_dir; the response's output is its path
+      pcm           stream the rendered float32 samples back instead of a WAV
+                    (a WAV is still written when save is given)
+
+    A response has ok, and error instead of an output when the request or any
+    of its operations failed.
+    """
+    def __init__(self, max_workers: int = 4, max_sessions: int = 8, output_dir: str = DEFAULT_OUTPUT_DIR):
+        self.max_sessions = max_sessions
+        self.output_dir = output_dir
+        self.sessions: "OrderedDict[str, RenderSession]" = OrderedDict()
+        self.pool = ThreadPoolExecutor(max_workers=max_workers)
+        self._lock = threading.Lock()
+
+    def session(self, track: str) -> RenderSession:
+        track = os.path.abspath(track)
+        with self._lock:
+            session = self.sessions.get(track)
+            if session is not None:
+                self.sessions.move_to_end(track)
+                return session
+        # Decoding happens outside the daemon lock so other tracks keep rendering
+        session = RenderSession(track)
+        evicted = []
+        with self._lock:
+            existing = self.sessions.get(track)
+            if existing is None:
+                self.sessions[track] = session
+                while len(self.sessions) > self.max_sessions:
+                    evicted.append(self.sessions.popitem(last=False)[1])
+        if existing is not None:
+            session.close()
+            return existing
+        # Outside the daemon lock: closing waits for requests still rendering on them
+        for old in evicted:
+            old.close()
+        return session
+
+    def submit(self, request: Dict[str, Any]):
+        return self.pool.submit(self.handle, request)
+
+    def handle(self, request: Dict[str, Any]) -> Tuple[Dict[str, Any], Optional[np.ndarray]]:
+        try:
+            track = request['track']
+            instructions = request.get('instructions', '')
+            if instructions.strip() in REJECTED_COMMANDS:
+                return {'ok': False, 'error': f"Command not supported by the daemon: {instructions}"}, None
+
+            session = self.session(track)
+            session.lock.acquire()
+            while session.closed:
+                # Evicted while this request waited for it, so open the track again
+                session.lock.release()
+                session = self.session(track)
+                session.lock.acquire()
+            try:
+                manager = session.manager
+                if not request.get('keep'):
+                    manager.working_file = manager.original_file
+                manager.processor.take_errors()
+                if instructions:
+                    manager.process_instructions(instructions)
+                output_file = manager.working_file
+                errors = manager.processor.take_errors()
+                if errors:
+                    # A failed operation leaves the state as it was, which is not what was asked for
+                    return {'ok': False, 'error': "; ".join(errors)}, None
+
+                # Session states are raw PCM that the temp budget or eviction may
+                # delete, so clients get a WAV of their own
+                response = {'ok': True, 'sr': manager.sr}
+                audio, sr = read_audio(output_file)
+                save_path = request.get('save')
+                if not save_path and not request.get('pcm'):
+                    os.makedirs(self.output_dir, exist_ok=True)
+                    base = os.path.splitext(os.path.basename(track))[0]
+                    fd, save_path = tempfile.mkstemp(suffix='.wav', prefix=f"{base}_", dir=self.output_dir)
+                    os.close(fd)
+                if save_path:
+                    sf.write(save_path, audio, sr)
+                    response['output'] = save_path
+                if request.get('pcm'):
+                    if len(audio.shape) == 1:
+                        audio = audio.reshape(-1, 1)
+                    response['frames'] = audio.shape[0]
+                    response['channels'] = audio.shape[1]
+                else:
+                    audio = None
+                return response, audio
+            finally:
+                session.lock.release()
+        except Exception as e:
+            return {'ok': False, 'error': str(e)}, None
+
+    def shutdown(self) -> None:
+        self.pool.shutdown(wait=True)
+        with self._lock:
+            sessions = list(self.sessions.values())
+            self.sessions.clear()
+        for session in sessions:
+            session.close()
+
+    def serve_unix(self, socket_path: str = DEFAULT_SOCKET_PATH) -> None:
+        daemon = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            # One JSON request per line; a JSON response line, followed by the raw
+            # samples when PCM was requested.
+            def handle(self):
+                for line in self.rfile:
+                    if not line.strip():
+                        continue
+                    try:
+                        request = json.loads(line)
+                    except ValueError as e:
+                        response, audio = {'ok': False, 'error': f"Invalid request: {str(e)}"}, None
+                    else:
+                        response, audio = daemon.submit(request).result()
+                    self.wfile.write((json.dumps(response) + "\n").encode())
+                    if audio is not None:
+                        self.wfile.write(np.ascontiguousarray(audio).tobytes())
+                    self.wfile.flush()
+
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        server = socketserver.ThreadingUnixStreamServer(socket_path, Handler)
+        server.daemon_threads = True
+        print(f"DJ Screwdriver daemon listening on {socket_path}")
+        try:
+            server.serve_forever()
+        finally:
+            server.server_close()
+            if os.path.exists(socket_path):
+                os.remove(socket_path)
+
+    def serve_http(self, host: str = "127.0.0.1", port: int = 8765) -> None:
+        daemon = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                if self.path != "/render":
+                    self.send_error(404)
+                    return
+                try:
+                    length = int(self.headers.get('Content-Length', 0))
+                    request = json.loads(self.rfile.read(length))
+                except ValueError as e:
+                    self._send_json(400, {'ok': False, 'error': f"Invalid request: {str(e)}"})
+                    return
+                response, audio = daemon.submit(request).result()
+                if audio is None:
+                    self._send_json(200 if response['ok'] else 400, response)
+                    return
+                body = np.ascontiguousarray(audio).tobytes()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/octet-stream')
+                self.send_header('Content-Length', str(len(body)))
+                self.send_header('X-Sample-Rate', str(response['sr']))
+                self.send_header('X-Channels', str(response['channels']))
+                if 'output' in response:
+                    self.send_header('X-Output', response['output'])
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _send_json(self, status, payload):
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        print(f"DJ Screwdriver daemon listening on http://{host}:{port}/render")
+        try:
+            server.serve_forever()
+        finally:
+            server.server_close()
+
+def send_request(request: Dict[str, Any], socket_path: str = DEFAULT_SOCKET_PATH) -> Tuple[Dict[str, Any], Optional[np.ndarray]]:
+    """Send one request to a running daemon over its Unix socket"""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(socket_path)
+        stream = sock.makefile('rwb')
+        stream.write((json.dumps(request) + "\n").encode())
+        stream.flush()
+        response = json.loads(stream.readline())
+        audio = None
+        if response.get('ok') and request.get('pcm'):
+            size = response['frames'] * response['channels'] * 4
+            data = stream.read(size)
+            audio = np.frombuffer(data, dtype='float32').reshape(-1, response['channels'])
+        return response, audio
+
+def main():
+    parser = argparse.ArgumentParser(description="Warm DJ Screwdriver render daemon")
+    parser.add_argument('--socket', default=DEFAULT_SOCKET_PATH, help="Unix socket path")
+    parser.add_argument('--http', type=int, default=None, help="Serve localhost HTTP on this port instead")
+    parser.add_argument('--workers', type=int, default=4, help="Render worker pool size")
+    parser.add_argument('--sessions', type=int, default=8, help="Warm sessions kept in memory")
+    parser.add_argument('--output-dir', default=DEFAULT_OUTPUT_DIR, help="Where renders without a save path go")
+    args = parser.parse_args()
+
+    daemon = RenderDaemon(max_workers=args.workers, max_sessions=args.sessions, output_dir=args.output_dir)
+    try:
+        if args.http is not None:
+            daemon.serve_http(port=args.http)
+        else:
+            daemon.serve_unix(args.socket)
+    except KeyboardInterrupt:
+        print("\nExiting...")
+    finally:
+        daemon.shutdown()
+
+if __name__ == "__main__":
+    main()
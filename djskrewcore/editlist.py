@@ -0,0 +1,57 @@
+from typing import Optional, List, Tuple
+import numpy as np
+
+class EditList:
+    """Splices of a source signal, recorded first and written out in one pass.
+
+    Beat effects describe their output as the source with some ranges replaced
+    by (possibly reversed, faded or enveloped) copies of source ranges. The
+    source is only ever read, so effects need no defensive copy and can never
+    corrupt what a later splice reads. materialize() copies the source into
+    the output buffer once and then applies the splices in order, so a later
+    splice overwrites an earlier one just like sequential slice assignments.
+    """
+    def __init__(self, source: np.ndarray):
+        self.source = source
+        self._edits: List[Tuple[int, int, int, bool, int, int, Optional[np.ndarray]]] = []
+
+    def __len__(self) -> int:
+        return len(self._edits)
+
+    def splice(self, start: int, src_start: int, length: int, reverse: bool = False,
+               fade_in: int = 0, fade_out: int = 0, envelope: Optional[np.ndarray] = None) -> int:
+        """Put source[src_start:src_start + length] at start, returns the samples actually placed.
+
+        Fades are linear ramps over the first/last samples of the placed piece,
+        envelope (if given) multiplies the piece sample by sample.
+        """
+        start, src_start = int(start), int(src_start)
+        length = min(int(length), len(self.source) - start, len(self.source) - src_start)
+        if length <= 0 or start < 0 or src_start < 0:
+            return 0
+        self._edits.append((start, src_start, length, reverse, int(fade_in), int(fade_out), envelope))
+        return length
+
+    def materialize(self, out: Optional[np.ndarray] = None) -> np.ndarray:
+        """Write the edited signal into out (which must not share memory with the source)"""
+        if out is None or out.shape != self.source.shape or out.dtype != self.source.dtype:
+            out = np.empty(self.source.shape, dtype=self.source.dtype)
+        np.copyto(out, self.source)
+        ramps = {}
+
+        def ramp(n: int) -> np.ndarray:
+            if n not in ramps:
+                ramps[n] = np.linspace(0, 1, n, dtype=out.dtype)
+            return ramps[n]
+
+        for start, src_start, length, reverse, fade_in, fade_out, envelope in self._edits:
+            piece = out[start:start + length]
+            source = self.source[src_start:src_start + length]
+            np.copyto(piece, source[::-1] if reverse else source)
+            if envelope is not None:
+                piece *= envelope[:length]
+            if 0 < fade_in <= length:
+                piece[:fade_in] *= ramp(fade_in)
+            if 0 < fade_out <= length:
+                piece[length - fade_out:] *= ramp(fade_out)[::-1]
+        return out
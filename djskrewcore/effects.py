@@ -4,129 +4,280 @@ import numpy as np
 import re
 import sys
 import sounddevice as sd
+import hashlib
+import threading
 from datetime import datetime
-from collections import deque
+from collections import deque, OrderedDict
+from djskrewcore.spectral import SpectralAudio, as_audio
+from djskrewcore import progress
+from djskrewcore.editlist import EditList
+
+class BeatGridCache:
+    """Beat analysis results keyed by a digest of the samples they came from.
+
+    Beat tracking is the most repeated analysis in a session, so every effect
+    and every session in the process shares one cache.
+    """
+    def __init__(self, max_size=64):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(y, sr, kind):
+        # Hashes the samples in place; only a strided view gets copied
+        y = np.ascontiguousarray(y)
+        digest = hashlib.blake2b(memoryview(y).cast('B'), digest_size=16).hexdigest()
+        return (digest, y.dtype.str, int(sr), len(y), kind)
+
+    def get_or_compute(self, y, sr, kind, compute):
+        key = self.key(y, sr, kind)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+        value = compute()
+        with self._lock:
+            self._entries[key] = value
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+beat_grid_cache = BeatGridCache()
 
 class AudioEffects:
     @staticmethod
     def estimate_bpm(y, sr):
-        onset_env = librosa.onset.onset_strength(y=y, sr=sr)
-        tempo, _ = librosa.beat.beat_track(onset_envelope=onset_env, sr=sr)
-        return float(tempo)
+        if isinstance(y, SpectralAudio):
+            # Same onset envelope librosa builds from samples, taken from the STFT we
+            # already hold; a pending stretch scales the tempo it will end up at
+            def compute_spectral():
+                mel = librosa.feature.melspectrogram(S=np.abs(y.D) ** 2, sr=sr)
+                onset_env = librosa.onset.onset_strength(S=librosa.power_to_db(mel), sr=sr)
+                tempo, _ = librosa.beat.beat_track(onset_envelope=onset_env, sr=sr, hop_length=y.hop_length)
+                return float(tempo)
+            return beat_grid_cache.get_or_compute(y.D, sr, 'bpm', compute_spectral) * y.rate
+
+        def compute():
+            onset_env = librosa.onset.onset_strength(y=y, sr=sr)
+            tempo, _ = librosa.beat.beat_track(onset_envelope=onset_env, sr=sr)
+            return float(tempo)
+        return beat_grid_cache.get_or_compute(y, sr, 'bpm', compute)
+
+    @staticmethod
+    def beat_track(y, sr, hop_length=512):
+        """Cached librosa.beat.beat_track, returns (tempo, beat_frames).
+
+        Beat frames are always counted in 512-sample frames, whatever hop the
+        analysis ran at, so callers see the same positions at every resolution.
+        """
+        def compute():
+            tempo, beat_frames = librosa.beat.beat_track(y=y, sr=sr, hop_length=hop_length)
+            return tempo, beat_frames * hop_length // 512
+        return beat_grid_cache.get_or_compute(y, sr, ('beats', hop_length), compute)
 
     @staticmethod
-    def match_bpm(y, sr, source_bpm, target_bpm):
+    def beat_samples(y, sr, hop_length=512):
+        """Beat positions in samples, the grid playback switches buffers on"""
+        _, beat_frames = AudioEffects.beat_track(y, sr, hop_length)
+        return librosa.frames_to_samples(beat_frames).astype(np.int64)
+
+    @staticmethod
+    def match_bpm(y, sr, source_bpm, target_bpm, engine='vocoder', hop_length=512):
         stretch_ratio = target_bpm / source_bpm
-        return librosa.effects.time_stretch(y, rate=stretch_ratio)
+        if engine == 'wsola':
+            return AudioEffects.wsola_stretch(y, sr, rate=stretch_ratio, hop_length=hop_length)
+        return AudioEffects.time_stretch(y, rate=stretch_ratio)
+
+    @staticmethod
+    def pitch_shift(y, sr, n_steps, spectral=False, res_type='kaiser_best', n_fft=2048, hop_length=512):
+        if not spectral and not isinstance(y, SpectralAudio):
+            return librosa.effects.pitch_shift(y, sr=sr, n_steps=n_steps, res_type=res_type,
+                                               n_fft=n_fft, hop_length=hop_length)
+
+        # Resample first, then stretch back to length: the stretch stays pending
+        # in the STFT domain for whatever spectral step comes next
+        if isinstance(y, SpectralAudio):
+            y = y.to_audio()
+        rate = 2.0 ** (-float(n_steps) / 12)
+        y_resampled = librosa.resample(y, orig_sr=float(sr) / rate, target_sr=sr, res_type=res_type)
+        shifted = SpectralAudio.from_audio(y_resampled, n_fft=n_fft, hop_length=hop_length).stretch(rate)
+        shifted.length = float(len(y))
+        return shifted
 
     @staticmethod
-    def pitch_shift(y, sr, n_steps):
-        return librosa.effects.pitch_shift(y, sr=sr, n_steps=n_steps)
+    def time_stretch(y, rate, n_fft=2048, hop_length=512):
+        if isinstance(y, SpectralAudio):
+            return y.stretch(rate)
+        return librosa.effects.time_stretch(y, rate=rate, n_fft=n_fft, hop_length=hop_length)
 
     @staticmethod
-    def time_stretch(y, rate):
-        return librosa.effects.time_stretch(y, rate=rate)
+    def wsola_stretch(y, sr, rate, frame_length=1024, tolerance=256, decimation=4, hop_length=512):
+        """Beat-aware WSOLA time stretch, rate > 1 speeds up like time_stretch.
+
+        Every beat of the cached grid is stretched on its own and its first frame
+        is taken exactly at the beat, so onsets land on the stretched grid instead
+        of being smeared by a search window. In between, each frame is picked
+        within +/- tolerance samples of its nominal position where it best
+        continues the previous one, searched on a decimated signal and refined at
+        full resolution. Frames are overlap-added one at a time into a float32
+        output buffer.
+        """
+        y = np.asarray(as_audio(y), dtype='float32')
+        rate = float(rate)
+        if rate <= 0:
+            raise ValueError(f"Stretch rate must be positive, got {rate}")
+        out_length = int(round(len(y) / rate))
+        if len(y) < frame_length or rate == 1.0:
+            return librosa.util.fix_length(y, size=out_length) if rate != 1.0 else y.copy()
+
+        _, beat_frames = AudioEffects.beat_track(y, sr, hop_length)
+        beats = librosa.frames_to_samples(beat_frames)
+        anchors = np.unique(np.concatenate([[0], beats[(beats > 0) & (beats < len(y))]])).astype(np.int64)
+
+        half = frame_length // 2
+        synthesis_hop = frame_length // 2
+        window = np.hanning(frame_length + 1)[:-1].astype('float32')
+        # Pad so frames and search windows never need bounds checks
+        pad = half + tolerance + frame_length
+        padded = np.zeros(len(y) + 2 * pad, dtype='float32')
+        padded[pad:pad + len(y)] = y
+        output = np.zeros(out_length + 2 * pad, dtype='float32')
+        norm = np.zeros(out_length + 2 * pad, dtype='float32')
+        template = np.empty(frame_length, dtype='float32')
+
+        segment_ends = np.append(anchors[1:], len(y))
+        for segment, (anchor, segment_end) in enumerate(zip(anchors, segment_ends)):
+            progress.report(segment, len(anchors))
+            out_start = int(round(anchor / rate))
+            out_end = int(round(segment_end / rate))
+            position = anchor  # centre of the frame taken from the input
+            k = 0
+            while out_start + k * synthesis_hop < out_end:
+                if k > 0:
+                    nominal = anchor + int(round(k * synthesis_hop * rate))
+                    # The input that naturally follows the frame we just used
+                    natural = position + synthesis_hop
+                    template[:] = padded[pad + natural - half:pad + natural + half]
+                    lo = pad + nominal - half - tolerance
+                    region = padded[lo:lo + frame_length + 2 * tolerance]
+                    coarse = np.correlate(region[::decimation], template[::decimation], mode='valid')
+                    best = int(np.argmax(coarse)) * decimation
+                    fine_lo = max(best - decimation + 1, 0)
+                    fine_hi = min(best + decimation, 2 * tolerance + 1)
+                    fine = np.correlate(region[fine_lo:fine_hi + frame_length - 1], template, mode='valid')
+                    position = nominal - tolerance + fine_lo + int(np.argmax(fine))
+                centre = pad + out_start + k * synthesis_hop
+                frame = padded[pad + position - half:pad + position + half]
+                output[centre - half:centre + half] += frame * window
+                norm[centre - half:centre + half] += window
+                k += 1
+
+        output = output[pad:pad + out_length]
+        norm = norm[pad:pad + out_length]
+        np.divide(output, norm, out=output, where=norm > 1e-3)
+        return output
 
     @staticmethod
-    def resample_time(y, sr, rate):
+    def resample_time(y, sr, rate, res_type='kaiser_best'):
         target_sr = int(sr * rate)
-        y_resampled = librosa.resample(y, orig_sr=sr, target_sr=target_sr, res_type='kaiser_best')
-        return librosa.resample(y_resampled, orig_sr=target_sr, target_sr=sr, res_type='kaiser_best')
+        y_resampled = librosa.resample(y, orig_sr=sr, target_sr=target_sr, res_type=res_type)
+        return librosa.resample(y_resampled, orig_sr=target_sr, target_sr=sr, res_type=res_type)
 
     @staticmethod
-    def create_loop(y, sr, beats, interval, length, repeat):
+    def _cut_points(y, sr, hop_length, beat_samples=None):
+        """Where the beat effects cut: beat_samples when the caller has the grid, else the tracked beat frames"""
+        if beat_samples is not None:
+            return np.asarray(beat_samples, dtype=np.int64)
+        _, beat_frames = AudioEffects.beat_track(y, sr, hop_length)
+        return beat_frames
+
+    @staticmethod
+    def _splice_sequence(edits, start, segment_length, pieces):
+        """Place (source start, length) pieces back to back from start, fading at the joins.
+
+        Pieces running past segment_length are cut off there.
+        """
+        fades = [0] * (len(pieces) + 1)
+        for j in range(1, len(pieces)):
+            fade_length = min(1024, pieces[j][1] // 4)
+            if pieces[j][1] >= fade_length and pieces[j - 1][1] >= fade_length:
+                fades[j] = fade_length
+        position = 0
+        for j, (src_start, length) in enumerate(pieces):
+            if position >= segment_length:
+                break
+            placed = min(length, segment_length - position)
+            edits.splice(start + position, src_start, placed, fade_in=fades[j],
+                         fade_out=fades[j + 1] if placed == length else 0)
+            position += length
+
+    @staticmethod
+    def create_loop(y, sr, beats, interval, length, repeat, hop_length=512, beat_samples=None, out=None):
         interval = int(interval)
         length = int(length)
         repeat = int(repeat)
-        tempo, beat_frames = librosa.beat.beat_track(y=y, sr=sr)
-        looped_audio = np.copy(y)
+        beat_frames = AudioEffects._cut_points(y, sr, hop_length, beat_samples)
+        edits = EditList(y)
         
         for i in range(0, len(beat_frames) - length, interval):
+            progress.report(i, len(beat_frames))
             if (i // interval) % repeat == 0:
                 start = beat_frames[i]
                 end = beat_frames[i + length]
-                loop_segment = y[start:end]
-                
-                fade_length = min(1024, len(loop_segment) // 4)
-                fade_in = np.linspace(0, 1, fade_length)
-                fade_out = np.linspace(1, 0, fade_length)
-                
-                if len(loop_segment) >= 2 * fade_length:
-                    loop_segment[:fade_length] *= fade_in
-                    loop_segment[-fade_length:] *= fade_out
-                
-                looped_audio[start:end] = loop_segment
+                fade_length = min(1024, (end - start) // 4)
+                edits.splice(start, start, end - start, fade_in=fade_length, fade_out=fade_length)
         
-        return looped_audio
+        return edits.materialize(out)
 
     @staticmethod
-    def chop_and_rearrange(y, sr, beats, size, step, repeat):
+    def chop_and_rearrange(y, sr, beats, size, step, repeat, hop_length=512, beat_samples=None, out=None):
         size = int(size)
         step = int(step)
         repeat = int(repeat)
-        tempo, beat_frames = librosa.beat.beat_track(y=y, sr=sr)
-        chopped_audio = np.copy(y)
+        beat_frames = AudioEffects._cut_points(y, sr, hop_length, beat_samples)
+        edits = EditList(y)
         pattern = [1, 2, 2, 1, 3, 3, 2, 1]
         
         for i in range(0, len(beat_frames) - size, step):
+            progress.report(i, len(beat_frames))
             if (i // step) % repeat == 0:
                 start = beat_frames[i]
                 end = beat_frames[i + size]
                 chunks = [
-                    y[beat_frames[j]:beat_frames[j + size]]
+                    (beat_frames[j], beat_frames[j + size] - beat_frames[j])
                     for j in range(i, i + size)
                 ]
-                
                 rearranged = [chunks[p % len(chunks)] for p in pattern]
-                
-                for j in range(1, len(rearranged)):
-                    fade_length = min(1024, len(rearranged[j]) // 4)
-                    fade_in = np.linspace(0, 1, fade_length)
-                    fade_out = np.linspace(1, 0, fade_length)
-                    if len(rearranged[j]) >= fade_length and len(rearranged[j - 1]) >= fade_length:
-                        rearranged[j][:fade_length] *= fade_in
-                        rearranged[j - 1][-fade_length:] *= fade_out
-                
-                concatenated = np.concatenate(rearranged)
-                segment_length = end - start
-                if len(concatenated) <= segment_length:
-                    chopped_audio[start:start + len(concatenated)] = concatenated
-                else:
-                    chopped_audio[start:end] = concatenated[:segment_length]
+                AudioEffects._splice_sequence(edits, start, end - start, rearranged)
         
-        return chopped_audio
+        return edits.materialize(out)
 
     @staticmethod
-    def add_stutter(y, sr, beats, count, length, repeat):
+    def add_stutter(y, sr, beats, count, length, repeat, hop_length=512, beat_samples=None, out=None):
         count = int(count)
         length = int(length)
         repeat = int(repeat)
-        tempo, beat_frames = librosa.beat.beat_track(y=y, sr=sr)
-        stuttered_audio = np.copy(y)
+        beat_frames = AudioEffects._cut_points(y, sr, hop_length, beat_samples)
+        edits = EditList(y)
+        envelopes = {}
         
         for i in range(0, len(beat_frames) - length, 1):
-            if (i % repeat) == 0:
+            progress.report(i, len(beat_frames))
+            if (i % repeat) == 0 and count > 0:
                 start = beat_frames[i]
                 end = beat_frames[i + length]
-                stutter_segment = y[start:end]
-                
-                stuttered = np.tile(stutter_segment, count)
-                
-                fade_out = np.linspace(1.0, 0.0, len(stutter_segment)) ** 2
-                for j in range(count):
-                    segment_start = j * len(stutter_segment)
-                    segment_end = (j + 1) * len(stutter_segment)
-                    if segment_end <= len(stuttered):
-                        stuttered[segment_start:segment_end] *= fade_out
-                
-                stutter_length = len(stuttered)
-                original_length = end - start
-                if stutter_length <= original_length:
-                    stuttered_audio[start:start + stutter_length] = stuttered
-                else:
-                    stuttered_audio[start:end] = stuttered[:original_length]
+                segment_length = end - start
+                if segment_length not in envelopes:
+                    envelopes[segment_length] = np.linspace(1.0, 0.0, segment_length, dtype=y.dtype) ** 2
+                # The repetitions are cut off at the segment's end, so only the first one shows
+                edits.splice(start, start, segment_length, envelope=envelopes[segment_length])
         
-        return stuttered_audio
+        return edits.materialize(out)
 
     @staticmethod
     def add_echo(y, sr, delay, count, decay):
@@ -140,6 +291,7 @@ class AudioEffects:
         output[:len(y)] = y
         
         for i in range(1, count + 1):
+            progress.report(i - 1, count)
             delay_samples = echo_samples * i
             amplitude = decay ** i
             if delay_samples < total_length:
@@ -153,77 +305,115 @@ class AudioEffects:
         return output
 
     @staticmethod
-    def reverse_by_beats(y, sr, beats, interval, length, repeat):
+    def reverse_by_beats(y, sr, beats, interval, length, repeat, hop_length=512, beat_samples=None, out=None):
         interval = int(interval)
         length = int(length)
         repeat = int(repeat)
-        tempo, beat_frames = librosa.beat.beat_track(y=y, sr=sr)
-        reversed_audio = np.copy(y)
+        beat_frames = AudioEffects._cut_points(y, sr, hop_length, beat_samples)
+        edits = EditList(y)
         
         for i in range(0, len(beat_frames) - length, interval):
+            progress.report(i, len(beat_frames))
             if (i // interval) % repeat == 0:
                 start = beat_frames[i]
                 end = beat_frames[i + length]
-                reversed_segment = y[start:end][::-1]
-                
-                fade_length = min(1024, len(reversed_segment) // 2)
-                fade_in = np.linspace(0, 1, fade_length)
-                fade_out = np.linspace(1, 0, fade_length)
-                
-                if len(reversed_segment) >= 2 * fade_length:
-                    reversed_segment[:fade_length] *= fade_in
-                    reversed_segment[-fade_length:] *= fade_out
-                
-                reversed_audio[start:end] = reversed_segment
+                fade_length = min(1024, (end - start) // 2)
+                edits.splice(start, start, end - start, reverse=True, fade_in=fade_length, fade_out=fade_length)
         
-        return reversed_audio
+        return edits.materialize(out)
 
     @staticmethod
-    def random_mix_beats(y, sr, beats, parts, beats_per_mash, repeat):
-        tempo, beat_frames = librosa.beat.beat_track(y=y, sr=sr)
-        mashed_audio = np.copy(y)
+    def random_mix_beats(y, sr, beats, parts, beats_per_mash, repeat, hop_length=512, beat_samples=None, out=None):
+        beat_frames = AudioEffects._cut_points(y, sr, hop_length, beat_samples)
+        edits = EditList(y)
         
         for i in range(0, len(beat_frames) - beats_per_mash, repeat):
+            progress.report(i, len(beat_frames))
             if (i // repeat) % repeat == 0:
                 start = beat_frames[i]
                 end = beat_frames[i + beats_per_mash]
-                mash_segment = y[start:end]
-                
-                part_length = len(mash_segment) // parts
-                sections = [
-                    mash_segment[j * part_length:(j + 1) * part_length]
-                    for j in range(parts)
-                ]
-                
+                part_length = (end - start) // parts
+                sections = [(start + j * part_length, part_length) for j in range(parts)]
                 np.random.shuffle(sections)
-                
-                for j in range(1, len(sections)):
-                    fade_length = min(1024, len(sections[j]) // 4)
-                    fade_in = np.linspace(0, 1, fade_length)
-                    fade_out = np.linspace(1, 0, fade_length)
-                    if len(sections[j]) >= fade_length and len(sections[j - 1]) >= fade_length:
-                        sections[j][:fade_length] *= fade_in
-                        sections[j - 1][-fade_length:] *= fade_out
-                
-                concatenated = np.concatenate(sections)
-                segment_length = end - start
-                if len(concatenated) <= segment_length:
-                    mashed_audio[start:start + len(concatenated)] = concatenated
-                else:
-                    mashed_audio[start:end] = concatenated[:segment_length]
+                AudioEffects._splice_sequence(edits, start, end - start, sections)
         
-        return mashed_audio
+        return edits.materialize(out)
+
+    @staticmethod
+    def layer_beats(y, sr, source, start_beat, length, interval, gain=1.0, replace=False,
+                    fade_length=256, hop_length=512):
+        """Play `length` beats of another track from `start_beat` every `interval` beats.
+
+        start_beat is a 0-based index into the source's beat grid; the layer and
+        splice commands count from 1 and convert.
+
+        The source is tempo-matched to y with one WSOLA stretch, then both beat
+        grids are used to map every target beat onto its source beat. The copy is
+        a single gather, mixed in at `gain` or replacing the target beats when
+        `replace` is set, with short fades at every slice edge.
+        """
+        start_beat, length, interval = int(start_beat), int(length), max(int(interval), 1)
+        target_tempo, target_frames = AudioEffects.beat_track(y, sr, hop_length)
+        source_tempo, _ = AudioEffects.beat_track(source, sr, hop_length)
+        target_tempo, source_tempo = float(np.atleast_1d(target_tempo)[0]), float(np.atleast_1d(source_tempo)[0])
+        if target_tempo > 0 and source_tempo > 0:
+            source = AudioEffects.wsola_stretch(source, sr, rate=target_tempo / source_tempo, hop_length=hop_length)
+        _, source_frames = AudioEffects.beat_track(source, sr, hop_length)
+        target_beats = librosa.frames_to_samples(target_frames)
+        source_beats = librosa.frames_to_samples(source_frames)
+
+        # Target beat t of each window takes source beat start_beat + (t - window start)
+        offsets = np.arange(length)
+        windows = np.arange(0, max(len(target_beats) - 1, 0), interval)
+        t = (windows[:, None] + offsets).ravel()
+        s = np.tile(start_beat + offsets, len(windows))
+        keep = (t < len(target_beats) - 1) & (s < len(source_beats) - 1) & (s >= 0)
+        t, s = t[keep], s[keep]
+        output = np.array(y, dtype='float32')
+        if len(t) == 0:
+            return output
+
+        lengths = target_beats[t + 1] - target_beats[t]
+        slice_starts = np.cumsum(lengths) - lengths
+        within = np.arange(lengths.sum()) - np.repeat(slice_starts, lengths)
+        target_idx = np.repeat(target_beats[t], lengths) + within
+        source_idx = np.minimum(np.repeat(source_beats[s], lengths) + within, len(source) - 1)
+
+        fade = np.minimum(within, np.repeat(lengths, lengths) - 1 - within).astype('float32')
+        np.minimum(fade / max(fade_length, 1), 1.0, out=fade)
+        layer = np.asarray(source, dtype='float32')[source_idx] * (fade * float(gain))
+        if replace:
+            output[target_idx] = output[target_idx] * (1.0 - fade) + layer
+        else:
+            output[target_idx] += layer
+        return output
+
+    @staticmethod
+    def hpss(y, n_fft=2048, hop_length=512):
+        """Split into (harmonic, percussive); the percussive part is the remainder, so they sum to y"""
+        D = librosa.stft(y, n_fft=n_fft, hop_length=hop_length)
+        harmonic_stft, _ = librosa.decompose.hpss(D)
+        harmonic = librosa.istft(harmonic_stft, hop_length=hop_length, n_fft=n_fft, length=len(y)).astype('float32')
+        return harmonic, np.asarray(y, dtype='float32') - harmonic
 
     @staticmethod
     def match_frequency_profile(modified, original, sr):
-        S_original = librosa.stft(original)
-        S_modified = librosa.stft(modified)
+        spectral = isinstance(modified, SpectralAudio)
+        if spectral:
+            modified = modified.resolve()
+            S_original = librosa.stft(original, n_fft=modified.n_fft, hop_length=modified.hop_length)
+            S_modified = modified.D
+        else:
+            S_original = librosa.stft(original)
+            S_modified = librosa.stft(modified)
         mag_original = np.abs(S_original)
         mag_modified = np.abs(S_modified)
         avg_original = np.mean(mag_original, axis=1, keepdims=True)
         avg_modified = np.mean(mag_modified, axis=1, keepdims=True)
         scaling = avg_original / (avg_modified + 1e-8)
         S_matched = S_modified * scaling
+        if spectral:
+            return modified.with_data(S_matched)
         return librosa.istft(S_matched)
 
     @staticmethod
@@ -235,19 +425,26 @@ class AudioEffects:
 
     @staticmethod
     def spectral_gate(y, sr, threshold_db, preserve_freq_ranges=None):
-        D = librosa.stft(y)
+        spectral = isinstance(y, SpectralAudio)
+        if spectral:
+            y = y.resolve()
+            D, n_fft = y.D, y.n_fft
+        else:
+            D, n_fft = librosa.stft(y), 2048
         mag, phase = librosa.magphase(D)
         mag_db = librosa.amplitude_to_db(mag)
         mask = mag_db > threshold_db
 
         if preserve_freq_ranges:
-            freqs = librosa.fft_frequencies(sr=sr, n_fft=2048)
+            freqs = librosa.fft_frequencies(sr=sr, n_fft=n_fft)
             for min_freq, max_freq in preserve_freq_ranges:
                 preserve_mask = (freqs >= min_freq) & (freqs <= max_freq)
                 mask[preserve_mask, :] = True
 
         mag_filtered = mag * mask
         D_filtered = mag_filtered * phase
+        if spectral:
+            return y.with_data(D_filtered)
         return librosa.istft(D_filtered)
 
 def parse_instructions(instructions):
@@ -0,0 +1,146 @@
+from typing import Optional, Tuple, List, Callable, Iterator
+import threading
+import numpy as np
+import librosa
+import soundfile as sf
+from djskrewcore.pcmstore import is_pcm, read_pcm
+
+def _to_mono(audio: np.ndarray) -> np.ndarray:
+    if audio.ndim > 1:
+        return audio.mean(axis=1, dtype='float32') if audio.shape[1] > 1 else audio[:, 0]
+    return audio
+
+def load_audio(file_path: str, sr: Optional[int] = None, offset: float = 0.0,
+               duration: Optional[float] = None) -> Tuple[np.ndarray, int]:
+    """Decode a mono float32 excerpt, like librosa.load but seeking where the format allows.
+
+    Intermediates are memory-mapped and soundfile formats are seeked to the
+    exact sample, so only the requested part is read. Anything else goes
+    through librosa/audioread, which has to decode up to the offset.
+    """
+    if is_pcm(file_path):
+        audio, native_sr = read_pcm(file_path)
+        start = int(offset * native_sr)
+        stop = None if duration is None else start + int(duration * native_sr)
+        y = _to_mono(audio[start:stop])
+    else:
+        try:
+            with sf.SoundFile(file_path) as f:
+                native_sr = f.samplerate
+                f.seek(min(int(offset * native_sr), f.frames))
+                frames = -1 if duration is None else int(duration * native_sr)
+                y = _to_mono(f.read(frames, dtype='float32', always_2d=True))
+        except RuntimeError:
+            # Not readable by libsndfile (e.g. MP3 on older versions)
+            y, native_sr = librosa.load(file_path, sr=None, offset=offset, duration=duration)
+
+    if sr is not None and sr != native_sr:
+        return librosa.resample(y, orig_sr=native_sr, target_sr=sr), sr
+    return y, native_sr
+
+class ProgressiveLoader:
+    """Decodes a whole file to mono float32 in blocks on a background thread.
+
+    The decoded prefix can be used while the rest is still decoding, e.g. to
+    start playback or analyse the intro of a long MP3. wait_for() blocks until
+    enough samples are there, result() until the file is complete.
+    """
+    def __init__(self, file_path: str, block_seconds: float = 5.0):
+        self.file_path = file_path
+        self.error: Optional[Exception] = None
+        self.done = False
+        self.frames = 0
+        self._callbacks: List[Callable[[np.ndarray], None]] = []
+        self._condition = threading.Condition()
+
+        if is_pcm(file_path):
+            audio, self.sr = read_pcm(file_path)
+            self._buffer = _to_mono(audio)
+            self.frames = len(self._buffer)
+            self.done = True
+            return
+
+        self._blocks, self.sr, expected = self._open(file_path, block_seconds)
+        self._buffer = np.empty(max(expected, 1), dtype='float32')
+        thread = threading.Thread(target=self._run)
+        thread.daemon = True
+        thread.start()
+
+    @staticmethod
+    def _open(file_path: str, block_seconds: float) -> Tuple[Iterator[np.ndarray], int, int]:
+        """Returns a block iterator, the sample rate and the expected number of frames"""
+        try:
+            info = sf.info(file_path)
+            blocksize = int(block_seconds * info.samplerate)
+            blocks = (_to_mono(block) for block in
+                      sf.blocks(file_path, blocksize=blocksize, dtype='float32', always_2d=True))
+            return blocks, info.samplerate, info.frames
+        except RuntimeError:
+            pass
+
+        import audioread
+        reader = audioread.audio_open(file_path)
+        channels = reader.channels
+
+        def blocks():
+            try:
+                for buf in reader:
+                    block = librosa.util.buf_to_float(buf, dtype=np.float32)
+                    if channels > 1:
+                        block = block.reshape(-1, channels).mean(axis=1)
+                    yield block
+            finally:
+                reader.close()
+        return blocks(), reader.samplerate, int(reader.duration * reader.samplerate)
+
+    def _run(self) -> None:
+        try:
+            for block in self._blocks:
+                self._append(block)
+        except Exception as e:
+            self.error = e
+        with self._condition:
+            self.done = True
+            self._condition.notify_all()
+            callbacks, self._callbacks = self._callbacks, []
+        if self.error is None:
+            result = self._buffer[:self.frames]
+            for callback in callbacks:
+                callback(result)
+
+    def _append(self, block: np.ndarray) -> None:
+        with self._condition:
+            end = self.frames + len(block)
+            if end > len(self._buffer):
+                # Only when the expected length was an estimate; views handed out
+                # earlier keep pointing at the old buffer, which stays valid
+                grown = np.empty(max(end, 2 * len(self._buffer)), dtype='float32')
+                grown[:self.frames] = self._buffer[:self.frames]
+                self._buffer = grown
+            self._buffer[self.frames:end] = block
+            self.frames = end
+            self._condition.notify_all()
+
+    def wait_for(self, frames: int, timeout: Optional[float] = None) -> np.ndarray:
+        """The decoded prefix once it holds at least `frames` samples (or the file ended)"""
+        with self._condition:
+            self._condition.wait_for(lambda: self.done or self.frames >= frames, timeout)
+            if self.error is not None:
+                raise self.error
+            return self._buffer[:self.frames]
+
+    def result(self) -> np.ndarray:
+        with self._condition:
+            self._condition.wait_for(lambda: self.done)
+        if self.error is not None:
+            raise self.error
+        return self._buffer[:self.frames]
+
+    def on_complete(self, callback: Callable[[np.ndarray], None]) -> None:
+        """Call back with the full signal once decoded, right away if it already is"""
+        with self._condition:
+            if not self.done:
+                self._callbacks.append(callback)
+                return
+        if self.error is None:
+            callback(self._buffer[:self.frames])
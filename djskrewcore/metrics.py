@@ -0,0 +1,120 @@
+from typing import Dict, Any, Optional
+import json
+import numpy as np
+
+class CallbackMetrics:
+    """Health counters for a real-time audio callback.
+
+    Everything the callback touches is allocated here up front: recording a
+    callback is a handful of scalar updates into preallocated histograms, with
+    no printing and no container growth. Reading the numbers (snapshot,
+    report, dump) happens on other threads.
+    """
+    BUCKET_US = 250
+    BUCKETS = 80  # 0-20 ms, the last bucket also counts anything slower
+
+    def __init__(self, sr: int, blocksize: int):
+        self.sr = sr
+        self.blocksize = blocksize
+        self.duration_hist = np.zeros(self.BUCKETS + 1, dtype=np.int64)
+        self.lock_wait_hist = np.zeros(self.BUCKETS + 1, dtype=np.int64)
+        self.reset()
+
+    def reset(self) -> None:
+        self.duration_hist.fill(0)
+        self.lock_wait_hist.fill(0)
+        self.callbacks = 0
+        self.frames = 0
+        self.underflows = 0
+        self.overflows = 0
+        self.priming = 0
+        self.lost_frames = 0
+        self.errors = 0
+        self.late = 0
+        self.contended = 0
+        self.total_duration = 0.0
+        self.max_duration = 0.0
+        self.total_lock_wait = 0.0
+        self.max_lock_wait = 0.0
+
+    def record_status(self, status: Any, frames: int) -> None:
+        if status.output_underflow:
+            self.underflows += 1
+            self.lost_frames += frames
+        if status.output_overflow:
+            self.overflows += 1
+        if status.priming_output:
+            self.priming += 1
+
+    def record_error(self, frames: int) -> None:
+        self.errors += 1
+        self.lost_frames += frames
+
+    def record(self, start: float, acquired: float, end: float, frames: int) -> None:
+        """Times are perf_counter() seconds taken on the audio thread"""
+        duration = end - start
+        lock_wait = acquired - start
+        self.callbacks += 1
+        self.frames += frames
+        self.total_duration += duration
+        self.total_lock_wait += lock_wait
+        if duration > self.max_duration:
+            self.max_duration = duration
+        if lock_wait > self.max_lock_wait:
+            self.max_lock_wait = lock_wait
+        if duration * self.sr > frames:
+            self.late += 1
+        self.duration_hist[min(int(duration * 1e6) // self.BUCKET_US, self.BUCKETS)] += 1
+        self.lock_wait_hist[min(int(lock_wait * 1e6) // self.BUCKET_US, self.BUCKETS)] += 1
+
+    def _percentile(self, hist: np.ndarray, q: float) -> Optional[float]:
+        total = int(hist.sum())
+        if total == 0:
+            return None
+        index = int(np.searchsorted(np.cumsum(hist), q * total))
+        return (index + 1) * self.BUCKET_US / 1000.0
+
+    def snapshot(self) -> Dict[str, Any]:
+        callbacks = max(self.callbacks, 1)
+        return {
+            'sr': self.sr,
+            'blocksize': self.blocksize,
+            'budget_ms': 1000.0 * self.blocksize / self.sr,
+            'callbacks': self.callbacks,
+            'frames': self.frames,
+            'underflows': self.underflows,
+            'overflows': self.overflows,
+            'priming': self.priming,
+            'lost_frames': self.lost_frames,
+            'errors': self.errors,
+            'late_callbacks': self.late,
+            'lock_contended': self.contended,
+            'mean_duration_ms': 1000.0 * self.total_duration / callbacks,
+            'max_duration_ms': 1000.0 * self.max_duration,
+            'p99_duration_ms': self._percentile(self.duration_hist, 0.99),
+            'mean_lock_wait_ms': 1000.0 * self.total_lock_wait / callbacks,
+            'max_lock_wait_ms': 1000.0 * self.max_lock_wait,
+            'p99_lock_wait_ms': self._percentile(self.lock_wait_hist, 0.99),
+            'bucket_ms': self.BUCKET_US / 1000.0,
+            'duration_histogram': self.duration_hist.tolist(),
+            'lock_wait_histogram': self.lock_wait_hist.tolist(),
+        }
+
+    def report(self) -> str:
+        s = self.snapshot()
+
+        def ms(value):
+            return "n/a" if value is None else f"{value:.2f} ms"
+
+        return "\n".join([
+            f"Callbacks: {s['callbacks']} ({s['frames']} frames, budget {s['budget_ms']:.1f} ms each)",
+            f"Callback time: mean {ms(s['mean_duration_ms'])}, p99 {ms(s['p99_duration_ms'])}, max {ms(s['max_duration_ms'])}",
+            f"Lock wait: mean {ms(s['mean_lock_wait_ms'])}, p99 {ms(s['p99_lock_wait_ms'])}, "
+            f"max {ms(s['max_lock_wait_ms'])}, contended {s['lock_contended']}",
+            f"Xruns: {s['underflows']} underflows, {s['overflows']} overflows, {s['late_callbacks']} late callbacks",
+            f"Lost frames: {s['lost_frames']} ({s['errors']} callback errors)",
+        ])
+
+    def dump(self, file_path: str) -> None:
+        with open(file_path, "w") as f:
+            json.dump(self.snapshot(), f, indent=2)
@@ -0,0 +1,285 @@
+from typing import Optional, List, Any
+import threading
+from time import perf_counter
+import numpy as np
+import librosa
+import sounddevice as sd
+from djskrewcore.effects import AudioEffects
+from djskrewcore.pcmstore import read_audio
+from djskrewcore.metrics import CallbackMetrics
+
+class Deck:
+    def __init__(self, audio: np.ndarray, sr: int, side: Optional[str] = None):
+        if len(audio.shape) == 1:
+            audio = audio.reshape(-1, 1)
+        self.audio = np.ascontiguousarray(audio, dtype='float32')
+        self.sr = sr
+        self.side = side
+        self.gain = 1.0
+        self.rate = 1.0
+        self.base_rate = 1.0
+        self.position = 0.0
+        self.bpm = 0.0
+        self.beat_samples = np.zeros(0, dtype=np.int64)
+        self._weight = 0.0
+        self.analyze()
+
+    @classmethod
+    def from_file(cls, file_path: str, side: Optional[str] = None) -> "Deck":
+        audio, sr = read_audio(file_path)
+        return cls(audio, sr, side)
+
+    def analyze(self) -> None:
+        mono = self.audio.mean(axis=1) if self.audio.shape[1] > 1 else self.audio[:, 0]
+        tempo, beat_frames = AudioEffects.beat_track(mono, self.sr)
+        self.bpm = float(tempo)
+        self.beat_samples = librosa.frames_to_samples(beat_frames).astype(np.int64)
+
+    @property
+    def length(self) -> int:
+        return len(self.audio)
+
+    @property
+    def speed(self) -> float:
+        """Source samples consumed per output sample"""
+        return self.base_rate * self.rate
+
+    @property
+    def effective_bpm(self) -> float:
+        return self.bpm * self.rate
+
+    def beat_phase(self) -> float:
+        """Position on the beat grid as beat index plus the fraction into that beat"""
+        beats = self.beat_samples
+        if len(beats) < 2:
+            return 0.0
+        i = int(np.searchsorted(beats, self.position, side='right')) - 1
+        i = min(max(i, 0), len(beats) - 2)
+        start, end = beats[i], beats[i + 1]
+        return i + (self.position - start) / max(end - start, 1)
+
+class DeckMixer:
+    """Mixes two or more decks in one output callback.
+
+    Decks on side 'a' and 'b' follow an equal-power crossfader, decks without a
+    side always play at their own gain. Decks are played back with linear
+    interpolation varispeed, so tempo sync is just a rate change. Every buffer
+    the callback touches is allocated up front.
+    """
+    def __init__(self, sr: int, channels: int = 1, blocksize: int = 2048):
+        self.sr = sr
+        self.channels = channels
+        self.blocksize = blocksize
+        self.decks: List[Deck] = []
+        self.master = 0
+        self.crossfader = 0.0
+        self.is_playing = False
+        self.stream: Optional[sd.OutputStream] = None
+        self._clock = 0
+        self._fade: Optional[tuple] = None
+        self._lock = threading.Lock()
+        self.metrics = CallbackMetrics(sr, blocksize)
+
+        self._ramp = np.arange(blocksize, dtype=np.float64)
+        self._pos = np.empty(blocksize, dtype=np.float64)
+        self._floor = np.empty(blocksize, dtype=np.float64)
+        self._idx0 = np.empty(blocksize, dtype=np.int64)
+        self._idx1 = np.empty(blocksize, dtype=np.int64)
+        self._frac = np.empty((blocksize, 1), dtype='float32')
+        self._gain = np.empty((blocksize, 1), dtype='float32')
+        self._a = np.empty((blocksize, channels), dtype='float32')
+        self._b = np.empty((blocksize, channels), dtype='float32')
+        self._mix = np.empty((blocksize, channels), dtype='float32')
+
+    def add_deck(self, deck: Deck) -> int:
+        self._fit_channels(deck)
+        deck.base_rate = deck.sr / self.sr
+        with self._lock:
+            if deck.side is None and len(self.decks) < 2:
+                deck.side = 'a' if not self.decks else 'b'
+            deck._weight = self._deck_weight(deck, self.crossfader)
+            self.decks.append(deck)
+            return len(self.decks) - 1
+
+    def replace_deck_audio(self, index: int, audio: np.ndarray, sr: int) -> None:
+        """Swap a deck's audio after an edit, keeping its relative position and settings"""
+        old = self.decks[index]
+        deck = Deck(audio, sr, old.side)
+        self._fit_channels(deck)
+        deck.base_rate = sr / self.sr
+        deck.gain = old.gain
+        deck.rate = old.rate
+        deck.position = old.position * deck.length / max(old.length, 1)
+        deck._weight = old._weight
+        with self._lock:
+            self.decks[index] = deck
+
+    def _fit_channels(self, deck: Deck) -> None:
+        if deck.audio.shape[1] == self.channels:
+            return
+        mono = deck.audio.mean(axis=1, keepdims=True)
+        deck.audio = np.ascontiguousarray(np.repeat(mono, self.channels, axis=1), dtype='float32')
+
+    def set_crossfader(self, value: float) -> None:
+        with self._lock:
+            self._fade = None
+            self.crossfader = min(max(float(value), 0.0), 1.0)
+
+    def set_gain(self, index: int, gain: float) -> None:
+        self.decks[index].gain = max(float(gain), 0.0)
+
+    def sync(self, index: int) -> None:
+        """Match a deck's tempo and beat phase to the master deck"""
+        with self._lock:
+            master = self.decks[self.master]
+            deck = self.decks[index]
+            if index == self.master or deck.bpm <= 0 or master.bpm <= 0:
+                return
+            deck.rate = master.effective_bpm / deck.bpm
+            phase = master.beat_phase() % 1.0
+            beats = deck.beat_samples
+            if len(beats) >= 2:
+                i = int(np.searchsorted(beats, deck.position, side='right')) - 1
+                i = min(max(i, 0), len(beats) - 2)
+                deck.position = float(beats[i] + phase * (beats[i + 1] - beats[i]))
+
+    def crossfade(self, beats: float) -> None:
+        """Move the crossfader to the other side over `beats` master beats, starting on the next beat"""
+        with self._lock:
+            master = self.decks[self.master]
+            target = 0.0 if self.crossfader >= 0.5 else 1.0
+            if master.effective_bpm <= 0:
+                self._fade = None
+                self.crossfader = target
+                return
+            beat_length = self.sr * 60.0 / master.effective_bpm
+            phase = master.beat_phase() % 1.0
+            start = self._clock + int((1.0 - phase) * beat_length)
+            end = start + int(beats * beat_length)
+            self._fade = (start, end, self.crossfader, target)
+
+    def start_playback(self) -> None:
+        with self._lock:
+            if self.stream is not None:
+                self.stream.close()
+            try:
+                self.stream = sd.OutputStream(
+                    samplerate=self.sr,
+                    channels=self.channels,
+                    callback=self._play_callback,
+                    blocksize=self.blocksize,
+                    dtype='float32'
+                )
+                self.stream.start()
+                self.is_playing = True
+            except Exception as e:
+                print(f"Error starting playback: {str(e)}")
+                self.is_playing = False
+
+    def pause_playback(self) -> None:
+        with self._lock:
+            if self.stream is not None:
+                try:
+                    self.stream.close()
+                    self.stream = None
+                    self.is_playing = False
+                except Exception as e:
+                    print(f"Error pausing playback: {str(e)}")
+
+    def toggle_playback(self) -> None:
+        if self.is_playing:
+            self.pause_playback()
+        else:
+            self.start_playback()
+
+    def _crossfader_at(self, clock: int) -> float:
+        if self._fade is None:
+            return self.crossfader
+        start, end, origin, target = self._fade
+        if clock <= start:
+            return origin
+        if clock >= end:
+            return target
+        return origin + (target - origin) * (clock - start) / (end - start)
+
+    @staticmethod
+    def _deck_weight(deck: Deck, crossfader: float) -> float:
+        if deck.side == 'a':
+            return float(np.cos(crossfader * np.pi / 2)) * deck.gain
+        if deck.side == 'b':
+            return float(np.sin(crossfader * np.pi / 2)) * deck.gain
+        return deck.gain
+
+    def _play_callback(self, outdata: np.ndarray, frames: int,
+                       time: Any, status: Optional[sd.CallbackFlags]) -> None:
+        start = perf_counter()
+        if status:
+            self.metrics.record_status(status, frames)
+        if not self._lock.acquire(blocking=False):
+            self.metrics.contended += 1
+            self._lock.acquire()
+        acquired = perf_counter()
+        try:
+            offset = 0
+            while offset < frames:
+                block = min(frames - offset, self.blocksize)
+                self._mix_block(block)
+                outdata[offset:offset + block] = self._mix[:block]
+                offset += block
+        except Exception:
+            self.metrics.record_error(frames)
+            outdata.fill(0)
+        finally:
+            self._lock.release()
+        self.metrics.record(start, acquired, perf_counter(), frames)
+
+    def _mix_block(self, frames: int) -> None:
+        mix = self._mix[:frames]
+        mix.fill(0)
+        end_crossfader = self._crossfader_at(self._clock + frames)
+        if self._fade is not None and self._clock + frames >= self._fade[1]:
+            self._fade = None
+        self.crossfader = end_crossfader
+
+        for deck in self.decks:
+            weight = self._deck_weight(deck, end_crossfader)
+            if deck.length == 0 or (weight == 0.0 and deck._weight == 0.0):
+                deck.position = (deck.position + frames * deck.speed) % max(deck.length, 1)
+                deck._weight = weight
+                continue
+            self._read_deck(deck, frames)
+
+            # Ramp the gain across the block so fader moves never click
+            gain = self._gain[:frames]
+            np.multiply(self._ramp[:frames, None], (weight - deck._weight) / frames, out=gain)
+            gain += deck._weight
+            a = self._a[:frames]
+            np.multiply(a, gain, out=a)
+            np.add(mix, a, out=mix)
+            deck._weight = weight
+
+        self._clock += frames
+
+    def _read_deck(self, deck: Deck, frames: int) -> None:
+        """Varispeed read of `frames` output samples from the deck into self._a"""
+        pos = self._pos[:frames]
+        floor = self._floor[:frames]
+        idx0 = self._idx0[:frames]
+        idx1 = self._idx1[:frames]
+        frac = self._frac[:frames]
+        a = self._a[:frames]
+        b = self._b[:frames]
+
+        np.multiply(self._ramp[:frames], deck.speed, out=pos)
+        pos += deck.position
+        np.floor(pos, out=floor)
+        np.subtract(pos, floor, out=frac[:, 0], casting='same_kind')
+        idx0[...] = floor
+        np.add(idx0, 1, out=idx1)
+        np.take(deck.audio, idx0, axis=0, out=a, mode='wrap')
+        np.take(deck.audio, idx1, axis=0, out=b, mode='wrap')
+        np.subtract(b, a, out=b)
+        np.multiply(b, frac, out=b)
+        np.add(a, b, out=a)
+
+        deck.position = (deck.position + frames * deck.speed) % deck.length
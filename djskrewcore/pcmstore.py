@@ -0,0 +1,175 @@
+from typing import Optional, Tuple, Set, Iterable
+import os
+import struct
+import zlib
+import tempfile
+import threading
+from collections import OrderedDict
+import numpy as np
+import soundfile as sf
+
+PCM_EXTENSION = ".pcm"
+PCM_MAGIC = b"DJSKPCM1"
+# magic, sample rate, channels, flags, frames, padding up to 32 bytes
+PCM_HEADER = struct.Struct("<8sIHHQ8x")
+FLAG_ZLIB = 1
+
+def is_pcm(file_path: str) -> bool:
+    return file_path.endswith(PCM_EXTENSION)
+
+def write_pcm(file_path: str, audio: np.ndarray, sr: int, compress: bool = False) -> int:
+    """Write float32 samples behind a small header, returns the bytes written"""
+    audio = np.ascontiguousarray(audio, dtype='<f4')
+    channels = 1 if audio.ndim == 1 else audio.shape[1]
+    # A view of the samples, so writing a state never copies it into a bytes object first
+    data = memoryview(audio).cast('B')
+    flags = 0
+    if compress:
+        data = zlib.compress(data, 1)
+        flags |= FLAG_ZLIB
+    with open(file_path, "wb") as f:
+        f.write(PCM_HEADER.pack(PCM_MAGIC, int(sr), channels, flags, audio.shape[0]))
+        f.write(data)
+    return PCM_HEADER.size + len(data)
+
+def pcm_info(file_path: str) -> Tuple[int, int, int, int]:
+    """Returns (frames, sr, channels, flags)"""
+    with open(file_path, "rb") as f:
+        magic, sr, channels, flags, frames = PCM_HEADER.unpack(f.read(PCM_HEADER.size))
+    if magic != PCM_MAGIC:
+        raise ValueError(f"Not a djskrewdriver PCM file: {file_path}")
+    return frames, sr, channels, flags
+
+def read_pcm(file_path: str) -> Tuple[np.ndarray, int]:
+    """Memory-map the samples; compressed files are inflated into memory instead.
+
+    The map is copy-on-write, so callers may modify the array without touching the file.
+    """
+    frames, sr, channels, flags = pcm_info(file_path)
+    shape = (frames,) if channels == 1 else (frames, channels)
+    if flags & FLAG_ZLIB:
+        with open(file_path, "rb") as f:
+            f.seek(PCM_HEADER.size)
+            data = zlib.decompress(f.read())
+        return np.frombuffer(data, dtype='<f4').reshape(shape).copy(), sr
+    if frames == 0:
+        return np.zeros(shape, dtype='float32'), sr
+    return np.memmap(file_path, dtype='<f4', mode='c', offset=PCM_HEADER.size, shape=shape), sr
+
+def read_audio(file_path: str) -> Tuple[np.ndarray, int]:
+    """Read an intermediate or any soundfile-readable file as float32"""
+    if is_pcm(file_path):
+        return read_pcm(file_path)
+    return sf.read(file_path, dtype='float32')
+
+def audio_frames(file_path: str) -> int:
+    if is_pcm(file_path):
+        return pcm_info(file_path)[0]
+    return sf.info(file_path).frames
+
+class PCMStore:
+    """Names, writes and budgets the intermediate states of one session.
+
+    Names come from a counter, so picking one never touches the disk. When the
+    files exceed the byte budget the oldest unpinned ones are first recompressed
+    and then deleted.
+    """
+    def __init__(self, temp_dir: str, budget_bytes: int = 2 * 1024 ** 3, compress: bool = False):
+        self.temp_dir = temp_dir
+        self.budget_bytes = budget_bytes
+        self.compress = compress
+        self.pinned: Set[str] = set()
+        self._sizes: "OrderedDict[str, int]" = OrderedDict()
+        self._compressed: Set[str] = set()
+        self._counter = 0
+        self._lock = threading.Lock()
+
+    @property
+    def used_bytes(self) -> int:
+        with self._lock:
+            return sum(self._sizes.values())
+
+    def new_path(self, prefix: str = "state") -> str:
+        with self._lock:
+            self._counter += 1
+            return os.path.join(self.temp_dir, f"{prefix}_{self._counter:06d}{PCM_EXTENSION}")
+
+    def write(self, audio: np.ndarray, sr: int, file_path: Optional[str] = None) -> str:
+        file_path = file_path or self.new_path()
+        size = write_pcm(file_path, audio, sr, compress=self.compress)
+        with self._lock:
+            self._sizes[file_path] = size
+            self._sizes.move_to_end(file_path)
+            if self.compress:
+                self._compressed.add(file_path)
+        self.enforce_budget()
+        return file_path
+
+    def adopt(self, file_path: str) -> None:
+        """Track a PCM file written elsewhere, e.g. by the render worker"""
+        try:
+            size = os.path.getsize(file_path)
+            compressed = bool(pcm_info(file_path)[3] & FLAG_ZLIB)
+        except (OSError, ValueError):
+            return
+        with self._lock:
+            if file_path in self._sizes:
+                return
+            self._sizes[file_path] = size
+            if compressed:
+                self._compressed.add(file_path)
+        self.enforce_budget()
+
+    def touch(self, file_path: str) -> None:
+        """Mark a file as recently used so it is evicted last"""
+        with self._lock:
+            if file_path in self._sizes:
+                self._sizes.move_to_end(file_path)
+
+    def pin(self, paths: Iterable[str]) -> None:
+        with self._lock:
+            self.pinned = set(paths)
+
+    def enforce_budget(self) -> None:
+        with self._lock:
+            candidates = [p for p in self._sizes if p not in self.pinned]
+            total = sum(self._sizes.values())
+
+        for file_path in candidates:
+            if total <= self.budget_bytes:
+                return
+            if file_path in self._compressed:
+                continue
+            tmp_path = None
+            try:
+                # A unique temp name, so two budget passes never write the same file
+                fd, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=os.path.dirname(file_path))
+                os.close(fd)
+                audio, sr = read_pcm(file_path)
+                size = write_pcm(tmp_path, audio, sr, compress=True)
+                del audio
+                os.replace(tmp_path, file_path)
+            except Exception as e:
+                print(f"Warning: Could not compress {file_path}: {str(e)}")
+                if tmp_path and os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                continue
+            with self._lock:
+                if file_path not in self._sizes:
+                    continue
+                total -= self._sizes[file_path] - size
+                self._sizes[file_path] = size
+                self._compressed.add(file_path)
+
+        for file_path in candidates:
+            if total <= self.budget_bytes:
+                return
+            with self._lock:
+                if file_path in self.pinned or file_path not in self._sizes:
+                    continue
+                total -= self._sizes.pop(file_path)
+                self._compressed.discard(file_path)
+            try:
+                os.remove(file_path)
+            except OSError:
+                pass
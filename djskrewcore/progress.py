@@ -0,0 +1,222 @@
+from typing import Optional, List, Dict, Any, Union
+import os
+import json
+import tempfile
+import threading
+from time import perf_counter
+
+_state = threading.local()
+
+def set_reporter(reporter: Optional[Any]) -> None:
+    """Install the reporter that effects running on this thread report to"""
+    _state.reporter = reporter
+
+def begin_operation(index: Union[int, str]) -> None:
+    """index is the operation's position, or 'stems' / 'enhance' for those stages"""
+    reporter = getattr(_state, 'reporter', None)
+    if reporter is not None:
+        reporter.begin_operation(index)
+
+def report(done: float, total: float) -> None:
+    """Called from effect loops; costs one attribute lookup when nobody listens"""
+    reporter = getattr(_state, 'reporter', None)
+    if reporter is not None:
+        reporter.update(done / total if total else 1.0)
+
+class ProgressReporter:
+    """Shows a render's progress and ETA on one console line.
+
+    Progress is weighted by the cost model's estimate of each operation.
+    Operations that do not report from inside (long librosa calls) advance on
+    their estimate, so the line keeps moving either way.
+    """
+    INTERVAL = 0.5
+
+    def __init__(self, estimates: List[float], stems: bool = False, label: str = "Rendering", show: bool = True):
+        # Laid out like CostModel.estimates: [stem split], operations..., mastering
+        self.estimates = [max(e, 1e-3) for e in estimates] or [1e-3]
+        self.offset = 1 if stems else 0
+        self.total = sum(self.estimates)
+        self.label = label
+        self.index = 0
+        self.fraction: Optional[float] = None
+        self.start = perf_counter()
+        self._operation_start = self.start
+        self._printed = False
+        self._done = threading.Event()
+        if show:
+            thread = threading.Thread(target=self._tick)
+            thread.daemon = True
+            thread.start()
+
+    def begin_operation(self, index: Union[int, str]) -> None:
+        if index == 'stems':
+            index = 0
+        elif index == 'enhance':
+            index = len(self.estimates) - 1
+        else:
+            index += self.offset
+        self.index = min(index, len(self.estimates) - 1)
+        self.fraction = None
+        self._operation_start = perf_counter()
+
+    def update(self, fraction: float) -> None:
+        self.fraction = min(max(fraction, 0.0), 1.0)
+
+    def overall(self) -> float:
+        estimate = self.estimates[self.index]
+        fraction = self.fraction
+        if fraction is None:
+            fraction = min((perf_counter() - self._operation_start) / estimate, 0.95)
+        return (sum(self.estimates[:self.index]) + estimate * fraction) / self.total
+
+    def eta(self) -> float:
+        elapsed = perf_counter() - self.start
+        overall = self.overall()
+        if overall > 0.05 and elapsed > 1.0:
+            return elapsed * (1.0 - overall) / overall
+        return max(self.total - elapsed, 0.0)
+
+    def _tick(self) -> None:
+        while not self._done.wait(self.INTERVAL):
+            print(f"\r{self.label}: {self.overall():4.0%}  ETA {self.eta():5.1f}s ", end='', flush=True)
+            self._printed = True
+
+    def finish(self) -> None:
+        self._done.set()
+        if self._printed:
+            print(f"\r{self.label}: 100%  took {perf_counter() - self.start:.1f}s   ")
+
+class RemoteReporter:
+    """Forwards progress from the render worker process to the parent"""
+    INTERVAL = 0.25
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.index = 0
+        self._last = 0.0
+
+    def begin_operation(self, index: Union[int, str]) -> None:
+        self.index = index
+        self.conn.send(('progress', index, None))
+
+    def update(self, fraction: float) -> None:
+        now = perf_counter()
+        if now - self._last >= self.INTERVAL:
+            self._last = now
+            self.conn.send(('progress', self.index, fraction))
+
+def forward(index: Union[int, str], fraction: Optional[float]) -> None:
+    """Apply a progress message from the worker to this thread's reporter"""
+    reporter = getattr(_state, 'reporter', None)
+    if reporter is None:
+        return
+    if fraction is None:
+        reporter.begin_operation(index)
+    else:
+        reporter.update(fraction)
+
+class CostModel:
+    """Predicts render seconds from past timings on this machine.
+
+    Keeps one rate per operation type and quality, in render seconds per
+    second of audio, scaled by the parameters that change the work (stretch
+    rate, echo count, region length). Every measured render nudges the rates
+    of its operations, and they are saved between sessions.
+    """
+    DEFAULT_PATH = os.path.join(os.path.expanduser("~"), ".cache", "djskrewdriver", "timings.json")
+    # Rough rates used until something was measured
+    PRIORS = {
+        'p': 0.15, 't': 0.1, 't:wsola': 0.03, 'bpm': 0.15, 'bpm:wsola': 0.05, 'rt': 0.2, 'a': 0.2,
+        'stut': 0.03, 'chop': 0.03, 'loop': 0.03, 'rev': 0.03, 'mash': 0.03, 'echo': 0.005,
+        'layer': 0.06, 'splice': 0.06, 'stems': 0.1, 'enhance': 0.05,
+    }
+    DEFAULT_RATE = 0.05
+    SMOOTHING = 0.3
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or self.DEFAULT_PATH
+        self.rates: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        try:
+            with open(self.path) as f:
+                self.rates = {k: float(v) for k, v in json.load(f).items()}
+        except (OSError, ValueError):
+            pass
+
+    @staticmethod
+    def kind(operation: Dict[str, Any]) -> str:
+        kind = operation['type']
+        values = operation.get('values') or []
+        if kind in ('t', 'bpm') and len(values) >= 2 and int(values[1]) == 1:
+            kind += ':wsola'
+        return kind
+
+    @staticmethod
+    def scale(operation: Dict[str, Any], duration: float) -> float:
+        values = operation.get('values') or []
+        scale = 1.0
+        if operation['type'] == 't' and values and values[0] > 0:
+            scale = max(1.0, 1.0 / values[0])  # slowing down makes more output
+        elif operation['type'] == 'echo' and len(values) >= 2:
+            scale = max(values[1], 1.0)
+        region = operation.get('region')
+        if region and duration > 0:
+            # Bars and beats at a typical 120 BPM, plus the rendered context
+            count = region['end'] - region['start'] + (0 if region['unit'] == 's' else 1)
+            seconds = {'s': 1.0, 'beat': 0.5, 'bar': 2.0}[region['unit']] * count
+            scale *= min((seconds + 4.0) / duration, 1.0)
+        return scale
+
+    def _rate(self, key: str) -> float:
+        return self.rates.get(key, self.PRIORS.get(key.split('@')[0], self.DEFAULT_RATE))
+
+    def _items(self, operations: List[Dict[str, Any]], duration: float, quality: str, enhance: bool):
+        items = [(f"stems@{quality}", 1.0)] if any(op.get('stem') for op in operations) else []
+        items += [(f"{self.kind(op)}@{quality}", self.scale(op, duration)) for op in operations]
+        items.append((f"enhance@{quality}", 1.0 if enhance else 0.0))
+        return items
+
+    def estimates(self, operations: List[Dict[str, Any]], duration: float, quality: str,
+                  enhance: bool = True) -> List[float]:
+        """Seconds for the stem split if any, each operation, then mastering"""
+        return [self._rate(key) * scale * duration for key, scale in self._items(operations, duration, quality, enhance)]
+
+    def estimate(self, operations: List[Dict[str, Any]], duration: float, quality: str,
+                 enhance: bool = True) -> float:
+        return sum(self.estimates(operations, duration, quality, enhance))
+
+    def record(self, operations: List[Dict[str, Any]], duration: float, quality: str,
+               enhance: bool, seconds: float) -> None:
+        """Spread a measured render time over its operations by their predicted share"""
+        if duration <= 0:
+            return
+        items = self._items(operations, duration, quality, enhance)
+        predicted = [self._rate(key) * scale * duration for key, scale in items]
+        total = sum(predicted)
+        if total <= 0:
+            return
+        with self._lock:
+            for (key, scale), share in zip(items, predicted):
+                if scale <= 0:
+                    continue
+                observed = seconds * share / total / (scale * duration)
+                self.rates[key] = (1 - self.SMOOTHING) * self._rate(key) + self.SMOOTHING * observed
+            # Under the lock, so an older snapshot never replaces a newer one
+            self._save(dict(self.rates))
+
+    def _save(self, rates: Dict[str, float]) -> None:
+        try:
+            directory = os.path.dirname(self.path)
+            os.makedirs(directory, exist_ok=True)
+            # A unique name per save, as other processes (render workers, daemons) save here too
+            fd, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=directory)
+            try:
+                with os.fdopen(fd, "w") as f:
+                    json.dump(rates, f, indent=2, sort_keys=True)
+                os.replace(tmp_path, self.path)
+            except OSError:
+                os.remove(tmp_path)
+                raise
+        except OSError as e:
+            print(f"Warning: Could not save render timings: {str(e)}")
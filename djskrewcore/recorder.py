@@ -0,0 +1,50 @@
+from typing import Dict, Any, List, Tuple
+import os
+import json
+import threading
+from datetime import datetime
+from time import perf_counter
+
+class SessionRecorder:
+    """Appends a session to a JSON lines log that replay.py can run again.
+
+    The first line describes the session, every following line is one
+    instruction string with its start time relative to the session start and
+    how long it took.
+    """
+    def __init__(self, file_path: str, input_file: str, quality: str):
+        self.file_path = file_path
+        self._start = perf_counter()
+        self._lock = threading.Lock()
+        self._file = open(file_path, "w")
+        self._write({
+            'session': 1,
+            'input': os.path.abspath(input_file),
+            'quality': quality,
+            'started': datetime.now().isoformat(timespec='seconds'),
+        })
+
+    def _write(self, entry: Dict[str, Any]) -> None:
+        with self._lock:
+            if self._file.closed:
+                return
+            self._file.write(json.dumps(entry) + "\n")
+            self._file.flush()
+
+    def now(self) -> float:
+        return perf_counter() - self._start
+
+    def record(self, instructions: str, started: float, seconds: float) -> None:
+        self._write({'t': round(started, 4), 'instructions': instructions, 'seconds': round(seconds, 4)})
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+def read_session(file_path: str) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+    """Returns the session header and its recorded instructions"""
+    with open(file_path) as f:
+        entries = [json.loads(line) for line in f if line.strip()]
+    if not entries or 'session' not in entries[0]:
+        raise ValueError(f"Not a recorded session: {file_path}")
+    return entries[0], entries[1:]
@@ -0,0 +1,55 @@
+from typing import Union
+import numpy as np
+import librosa
+
+class SpectralAudio:
+    """An STFT that is passed between consecutive spectral operations.
+
+    Time stretches are only recorded in `rate` and applied with a single
+    phase vocoder pass when the magnitudes are needed, so a chain such as
+    pitch shift, time stretch and the mastering gate/EQ costs one forward and
+    one inverse transform instead of one round trip per step.
+    """
+    def __init__(self, D: np.ndarray, length: float, n_fft: int = 2048,
+                 hop_length: int = 512, rate: float = 1.0):
+        self.D = D
+        # Time-domain length once the pending stretch has been applied
+        self.length = length
+        self.n_fft = n_fft
+        self.hop_length = hop_length
+        self.rate = rate
+
+    @classmethod
+    def from_audio(cls, y: np.ndarray, n_fft: int = 2048, hop_length: int = 512) -> "SpectralAudio":
+        D = librosa.stft(y, n_fft=n_fft, hop_length=hop_length)
+        return cls(D, float(len(y)), n_fft, hop_length)
+
+    def stretch(self, rate: float) -> "SpectralAudio":
+        return SpectralAudio(self.D, self.length / rate, self.n_fft, self.hop_length, self.rate * rate)
+
+    def resolve(self) -> "SpectralAudio":
+        """Apply the pending stretch so D holds the final frames"""
+        if self.rate == 1.0:
+            return self
+        D = librosa.phase_vocoder(self.D, rate=self.rate, hop_length=self.hop_length, n_fft=self.n_fft)
+        return SpectralAudio(D, self.length, self.n_fft, self.hop_length)
+
+    def with_data(self, D: np.ndarray) -> "SpectralAudio":
+        """A resolved copy carrying new frames of the same length"""
+        return SpectralAudio(D, self.length, self.n_fft, self.hop_length)
+
+    def to_audio(self) -> np.ndarray:
+        resolved = self.resolve()
+        return librosa.istft(resolved.D, hop_length=self.hop_length, n_fft=self.n_fft,
+                             length=int(round(self.length)))
+
+def as_spectral(audio: Union[np.ndarray, SpectralAudio], n_fft: int = 2048,
+                hop_length: int = 512) -> SpectralAudio:
+    if isinstance(audio, SpectralAudio):
+        return audio
+    return SpectralAudio.from_audio(audio, n_fft=n_fft, hop_length=hop_length)
+
+def as_audio(audio: Union[np.ndarray, SpectralAudio]) -> np.ndarray:
+    if isinstance(audio, SpectralAudio):
+        return audio.to_audio()
+    return audio
@@ -0,0 +1,54 @@
+from typing import Set, Tuple
+import threading
+from time import perf_counter
+import numpy as np
+import librosa
+
+# (sample rate, resampler) pairs already warmed up in this process
+_warmed: Set[Tuple[int, str]] = set()
+_lock = threading.Lock()
+
+def synthetic_signal(sr: int, seconds: float = 3.0) -> np.ndarray:
+    """A click track over a low tone, enough for the beat tracker to find beats"""
+    t = np.arange(int(sr * seconds)) / sr
+    y = 0.1 * np.sin(2 * np.pi * 110 * t)
+    beat = sr // 2
+    for start in range(0, len(y) - 512, beat):
+        y[start:start + 512] += np.hanning(512)
+    return y.astype('float32')
+
+def warm_up(sr: int, res_type: str = 'kaiser_best') -> float:
+    """Run the jitted and resampling code paths once, returns the seconds it took.
+
+    Goes straight to librosa so the synthetic signal never lands in the
+    beat grid cache.
+    """
+    start = perf_counter()
+    y = synthetic_signal(sr)
+    onset_env = librosa.onset.onset_strength(y=y, sr=sr)
+    librosa.beat.beat_track(onset_envelope=onset_env, sr=sr)
+    librosa.beat.beat_track(y=y, sr=sr, hop_length=512)
+    resampled = librosa.resample(y, orig_sr=sr, target_sr=int(sr * 0.9), res_type=res_type)
+    librosa.resample(resampled, orig_sr=int(sr * 0.9), target_sr=sr, res_type=res_type)
+    D = librosa.stft(y, n_fft=2048, hop_length=512)
+    D = librosa.phase_vocoder(D, rate=1.25, hop_length=512)
+    librosa.istft(D, hop_length=512)
+    librosa.feature.melspectrogram(S=np.abs(D) ** 2, sr=sr)
+    return perf_counter() - start
+
+def start_warmup(sr: int, res_type: str = 'kaiser_best') -> None:
+    """Warm up on a background thread, once per sample rate and resampler"""
+    with _lock:
+        if (sr, res_type) in _warmed:
+            return
+        _warmed.add((sr, res_type))
+
+    def run():
+        try:
+            warm_up(sr, res_type)
+        except Exception as e:
+            print(f"Warning: Warm-up failed: {str(e)}")
+
+    thread = threading.Thread(target=run)
+    thread.daemon = True
+    thread.start()
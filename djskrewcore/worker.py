@@ -0,0 +1,307 @@
+from typing import List, Dict, Any, Callable, Optional, Tuple, TypeVar
+import threading
+import traceback
+import multiprocessing
+from multiprocessing import shared_memory
+import numpy as np
+from djskrewcore import progress
+
+T = TypeVar('T')
+
+def _attach(name: str, frames: int):
+    shm = shared_memory.SharedMemory(name=name)
+    return shm, np.ndarray((frames,), dtype='float32', buffer=shm.buf)
+
+def _beat_grid(y: np.ndarray, sr: int) -> np.ndarray:
+    from djskrewcore.effects import AudioEffects
+    try:
+        return AudioEffects.beat_samples(y, sr)
+    except Exception:
+        return np.zeros(0, dtype=np.int64)
+
+def _worker_main(conn) -> None:
+    """Render loop of the child process.
+
+    Per request: read the input from the parent's shared memory, render,
+    report the output length and its beat grid, then copy the output into the
+    block the parent allocated for it. All blocks are created and unlinked by
+    the parent. File requests map the input state and write the output state
+    directly, and only report the beat grid.
+    """
+    import tempfile
+    from djskrewcore.audio import AudioProcessor, QUALITY_PROFILES
+    from djskrewcore.loader import load_audio
+    from djskrewcore.pcmstore import write_pcm
+    from djskrewcore.warmup import warm_up
+
+    processor = None
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            return
+        if message is None:
+            return
+        if message[0] == 'warmup':
+            try:
+                warm_up(message[1], message[2])
+            except Exception:
+                pass
+            continue
+        if message[0] == 'beats':
+            _, input_name, frames, sr = message
+            shm, y = _attach(input_name, frames)
+            try:
+                beats = _beat_grid(y, sr)
+            finally:
+                del y
+                shm.close()
+            conn.send(('beats', beats))
+            continue
+        if message[0] == 'render_file':
+            _, input_file, output_file, operations, quality, stem_files = message
+            try:
+                if processor is None:
+                    processor = AudioProcessor(tempfile.gettempdir())
+                y, sr = load_audio(input_file)
+                progress.set_reporter(progress.RemoteReporter(conn))
+                try:
+                    output = np.asarray(processor._render(y, sr, operations, QUALITY_PROFILES[quality], stem_files),
+                                        dtype='float32')
+                finally:
+                    progress.set_reporter(None)
+                write_pcm(output_file, output, sr)
+            except Exception as e:
+                conn.send(('error', str(e), traceback.format_exc()))
+                continue
+            conn.send(('written', _beat_grid(output, sr), processor.take_errors()))
+            continue
+
+        _, input_name, frames, sr, operations, quality, stem_files = message
+        try:
+            if processor is None:
+                processor = AudioProcessor(tempfile.gettempdir())
+            shm, y = _attach(input_name, frames)
+            progress.set_reporter(progress.RemoteReporter(conn))
+            try:
+                output = np.asarray(processor._render(y, sr, operations, QUALITY_PROFILES[quality], stem_files),
+                                    dtype='float32')
+                if np.may_share_memory(output, y):
+                    # Renders no longer copy their input, and the block is closed below
+                    output = output.copy()
+            finally:
+                progress.set_reporter(None)
+                del y
+                shm.close()
+        except Exception as e:
+            conn.send(('error', str(e), traceback.format_exc()))
+            continue
+
+        # Analysed here so the player only has to swap buffers
+        conn.send(('size', len(output), _beat_grid(output, sr), processor.take_errors()))
+        reply = conn.recv()
+        if reply is None:
+            return
+        shm, target = _attach(reply[1], len(output))
+        target[:] = output
+        del target
+        shm.close()
+        conn.send(('done',))
+
+class RenderWorker:
+    """Runs renders in a separate process so they never hold the player's GIL.
+
+    Samples travel through shared memory blocks instead of being pickled. The
+    parent creates and unlinks every block; the child only attaches to them.
+    Intermediate states skip even that, see render_file(). Requests are served
+    one at a time.
+    """
+    def __init__(self):
+        self._context = multiprocessing.get_context('spawn')
+        self._lock = threading.Lock()
+        self._conn = None
+        self._process = None
+        self._start()
+
+    def _start(self) -> None:
+        parent, child = self._context.Pipe()
+        self._process = self._context.Process(target=_worker_main, args=(child,))
+        self._process.daemon = True
+        self._process.start()
+        child.close()
+        self._conn = parent
+
+    def warm_up(self, sr: int, res_type: str) -> None:
+        """Let the child compile its kernels before the first request"""
+        with self._lock:
+            self._conn.send(('warmup', sr, res_type))
+
+    def render(self, y: np.ndarray, sr: int, operations: List[Dict[str, Any]], quality: str,
+               consume: Callable[[np.ndarray], T], stem_files: Optional[Tuple[str, str]] = None,
+               on_start: Optional[Callable[[], None]] = None) -> Tuple[T, np.ndarray, List[str]]:
+        """Render mono samples in the worker and hand the result to consume().
+
+        The array passed to consume() is a view of shared memory that is freed
+        when consume() returns, so write it out or copy it there. Returns what
+        consume() returned, the beat grid of the output in samples and the
+        failures of operations that were skipped.
+        on_start is called once the worker is free, when rendering begins.
+        """
+        y = np.asarray(y, dtype='float32')
+        with self._lock:
+            if on_start is not None:
+                on_start()
+            if not self._process.is_alive():
+                print("Render worker stopped, starting a new one.")
+                self._start()
+            input_shm = shared_memory.SharedMemory(create=True, size=max(y.nbytes, 1))
+            output_shm: Optional[shared_memory.SharedMemory] = None
+            try:
+                np.ndarray(y.shape, dtype='float32', buffer=input_shm.buf)[:] = y
+                self._conn.send(('render', input_shm.name, len(y), sr, operations, quality, stem_files))
+                reply = self._receive()
+                if reply[0] == 'error':
+                    raise RuntimeError(f"{reply[1]}\n{reply[2]}")
+
+                frames, beats, errors = reply[1], reply[2], reply[3]
+                output_shm = shared_memory.SharedMemory(create=True, size=max(frames * 4, 1))
+                self._conn.send(('output', output_shm.name))
+                self._receive()
+                output = np.ndarray((frames,), dtype='float32', buffer=output_shm.buf)
+                try:
+                    return consume(output), beats, errors
+                finally:
+                    del output
+            finally:
+                for shm in (input_shm, output_shm):
+                    if shm is not None:
+                        shm.close()
+                        shm.unlink()
+
+    def render_file(self, input_file: str, output_file: str, operations: List[Dict[str, Any]], quality: str,
+                    stem_files: Optional[Tuple[str, str]] = None,
+                    on_start: Optional[Callable[[], None]] = None) -> Tuple[np.ndarray, List[str]]:
+        """Render a PCM state into another one, both read and written by the worker.
+
+        Returns the beat grid of the output in samples and the failures of
+        operations that were skipped. on_start is called like in render().
+        """
+        with self._lock:
+            if on_start is not None:
+                on_start()
+            if not self._process.is_alive():
+                print("Render worker stopped, starting a new one.")
+                self._start()
+            self._conn.send(('render_file', input_file, output_file, operations, quality, stem_files))
+            reply = self._receive()
+            if reply[0] == 'error':
+                raise RuntimeError(f"{reply[1]}\n{reply[2]}")
+            return reply[1], reply[2]
+
+    def beat_grid(self, y: np.ndarray, sr: int) -> np.ndarray:
+        """Beat positions of mono samples in samples, tracked in the worker"""
+        y = np.asarray(y, dtype='float32')
+        with self._lock:
+            if not self._process.is_alive():
+                print("Render worker stopped, starting a new one.")
+                self._start()
+            shm = shared_memory.SharedMemory(create=True, size=max(y.nbytes, 1))
+            try:
+                np.ndarray(y.shape, dtype='float32', buffer=shm.buf)[:] = y
+                self._conn.send(('beats', shm.name, len(y), sr))
+                return self._receive()[1]
+            finally:
+                shm.close()
+                shm.unlink()
+
+    def _receive(self):
+        """Next reply from the worker, passing its progress messages on along the way"""
+        while True:
+            try:
+                message = self._conn.recv()
+            except EOFError:
+                raise RuntimeError("Render worker exited while rendering")
+            if message[0] != 'progress':
+                return message
+            progress.forward(message[1], message[2])
+
+    def close(self) -> None:
+        with self._lock:
+            try:
+                self._conn.send(None)
+            except (OSError, ValueError):
+                pass
+            self._process.join(timeout=2)
+            if self._process.is_alive():
+                self._process.terminate()
+
+class RenderWorkerPool:
+    """Hands each render to an idle RenderWorker, starting up to size of them.
+
+    Workers start on demand, so a session that renders one thing at a time
+    keeps a single child, while side-by-side renders (variations) get one
+    child each instead of queueing behind one another.
+    """
+    def __init__(self, size: int = 1):
+        self.size = max(size, 1)
+        self._idle: List[RenderWorker] = []
+        self._workers: List[RenderWorker] = []
+        self._warmups: List[Tuple[int, str]] = []
+        self._condition = threading.Condition()
+
+    def _acquire(self) -> RenderWorker:
+        with self._condition:
+            while not self._idle and len(self._workers) >= self.size:
+                self._condition.wait()
+            if self._idle:
+                return self._idle.pop()
+            worker = RenderWorker()
+            for sr, res_type in self._warmups:
+                worker.warm_up(sr, res_type)
+            self._workers.append(worker)
+            return worker
+
+    def _release(self, worker: RenderWorker) -> None:
+        with self._condition:
+            self._idle.append(worker)
+            self._condition.notify()
+
+    def warm_up(self, sr: int, res_type: str) -> None:
+        """Warm up the running workers and every one started later"""
+        with self._condition:
+            self._warmups.append((sr, res_type))
+            workers = list(self._workers)
+        if not workers:
+            self._release(self._acquire())
+            return
+        for worker in workers:
+            worker.warm_up(sr, res_type)
+
+    def render(self, *args, **kwargs):
+        """Same as RenderWorker.render, on whichever worker is free first"""
+        worker = self._acquire()
+        try:
+            return worker.render(*args, **kwargs)
+        finally:
+            self._release(worker)
+
+    def render_file(self, *args, **kwargs):
+        """Same as RenderWorker.render_file, on whichever worker is free first"""
+        worker = self._acquire()
+        try:
+            return worker.render_file(*args, **kwargs)
+        finally:
+            self._release(worker)
+
+    def beat_grid(self, y: np.ndarray, sr: int) -> np.ndarray:
+        worker = self._acquire()
+        try:
+            return worker.beat_grid(y, sr)
+        finally:
+            self._release(worker)
+
+    def close(self) -> None:
+        with self._condition:
+            workers, self._workers, self._idle = self._workers, [], []
+        for worker in workers:
+            worker.close()
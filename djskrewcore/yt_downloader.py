@@ -1,11 +1,62 @@
 import yt_dlp
 import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
 
 # Enter the YouTube video URL
 url = "https://www.youtube.com/watch?v=mNNm9qclQiY"
 
+VIDEO_ID_PATTERN = re.compile(r"(?:v=|youtu\.be/|shorts/|embed/)([\w-]{11})")
 
-def download_video(url, output_path, progress_callback=None):
+# Downloads already completed in this process, keyed by video id
+_downloaded: Dict[str, str] = {}
+_downloaded_lock = threading.Lock()
+# Held while a video id downloads, so a second request for it waits and reuses the file
+_id_locks: Dict[str, threading.Lock] = {}
+
+
+def _downloads_dir(output_path):
+    return os.path.join(output_path, "downloads")
+
+
+def _video_id_from_url(url) -> Optional[str]:
+    match = VIDEO_ID_PATTERN.search(url)
+    return match.group(1) if match else None
+
+
+def _is_playlist_url(url) -> bool:
+    """Only playlist pages, or links without a video; watch?v=...&list=... is the one video"""
+    return "/playlist" in url or _video_id_from_url(url) is None
+
+
+def _find_downloaded(output_path, video_id) -> Optional[str]:
+    with _downloaded_lock:
+        cached = _downloaded.get(video_id)
+    if cached and os.path.exists(cached):
+        return cached
+
+    # Files downloaded by an earlier run carry the id in their name
+    downloads_dir = _downloads_dir(output_path)
+    if not os.path.isdir(downloads_dir):
+        return None
+    marker = f"[{video_id}]."
+    for name in os.listdir(downloads_dir):
+        if marker in name and not name.endswith((".part", ".ytdl")):
+            file_path = os.path.join(downloads_dir, name)
+            with _downloaded_lock:
+                _downloaded[video_id] = file_path
+            return file_path
+    return None
+
+
+def _id_lock(video_id) -> threading.Lock:
+    with _downloaded_lock:
+        return _id_locks.setdefault(video_id, threading.Lock())
+
+
+def _progress_hook(progress_callback):
     def progress_hook(d):
         if d['status'] == 'downloading' and progress_callback:
             try:
@@ -13,28 +64,112 @@ def download_video(url, output_path, progress_callback=None):
                 progress_callback(int(float(percent)))
             except ValueError:
                 pass  # Ignore if we can't convert the percentage to a number
+    return progress_hook
+
+
+def download_video(url, output_path, progress_callback=None, native=False):
+    """Download the audio of a single video.
+
+    With native=True the best audio stream is kept as-is (webm/opus, m4a)
+    instead of being transcoded to MP3, so it is decoded only once when loaded.
+    """
+    video_id = _video_id_from_url(url) if native else None
+    if video_id is None:
+        return _download(url, output_path, progress_callback, native)
+    with _id_lock(video_id):
+        existing = _find_downloaded(output_path, video_id)
+        if existing:
+            return existing
+        return _download(url, output_path, progress_callback, native)
 
+
+def _download(url, output_path, progress_callback, native):
     ydl_opts = {
         "format": "bestaudio/best",
-        "outtmpl": os.path.join(output_path, "downloads", "%(title)s.%(ext)s"),
+        "outtmpl": os.path.join(_downloads_dir(output_path), "%(title)s.%(ext)s"),
         "noplaylist": True,
-        "postprocessors": [
+        "progress_hooks": [_progress_hook(progress_callback)],
+    }
+    if native:
+        ydl_opts["outtmpl"] = os.path.join(_downloads_dir(output_path), "%(title)s [%(id)s].%(ext)s")
+    else:
+        ydl_opts["postprocessors"] = [
             {
                 "key": "FFmpegExtractAudio",
                 "preferredcodec": "mp3",
                 "preferredquality": "192",
             }
-        ],
-        "progress_hooks": [progress_hook],
-    }
+        ]
     try:
         with yt_dlp.YoutubeDL(ydl_opts) as ydl:
             info = ydl.extract_info(url, download=True)
             filename = ydl.prepare_filename(info)
-            final_filename = os.path.splitext(filename)[0] + ".mp3"
+            if native:
+                final_filename = filename
+            else:
+                final_filename = os.path.splitext(filename)[0] + ".mp3"
             if os.path.exists(final_filename):
+                if native:
+                    with _downloaded_lock:
+                        _downloaded[info["id"]] = final_filename
                 return final_filename
             else:
                 return f"Error: File not found after download: {final_filename}"
     except Exception as e:
-        return f"Error: {str(e)}"
\ No newline at end of file
+        return f"Error: {str(e)}"
+
+
+def download_audio(url, output_path, progress_callback=None, max_workers=4,
+                   limit: Optional[int] = None) -> List[str]:
+    """Download native audio for a video or every entry of a playlist.
+
+    A video link that also names a list (a radio mix, a playlist it was
+    opened from) downloads just that video. Playlist entries are fetched
+    concurrently on a bounded worker pool and entries that were downloaded
+    before are returned without a new request; an entry listed twice is
+    downloaded once. With limit, only the first limit entries are fetched.
+    Failed entries are reported and left out of the returned list.
+    """
+    if not _is_playlist_url(url):
+        return _collect([download_video(url, output_path, progress_callback, native=True)])
+
+    try:
+        with yt_dlp.YoutubeDL({"extract_flat": "in_playlist", "quiet": True}) as ydl:
+            info = ydl.extract_info(url, download=False)
+    except Exception as e:
+        print(f"Error: {str(e)}")
+        return []
+
+    entries = info.get("entries")
+    if entries is None:
+        return _collect([download_video(url, output_path, progress_callback, native=True)])
+
+    urls = []
+    seen = set()
+    for entry in entries:
+        if not entry:
+            continue
+        entry_url = entry.get("url") or entry.get("webpage_url")
+        if entry.get("id") and not (entry_url or "").startswith("http"):
+            entry_url = f"https://www.youtube.com/watch?v={entry['id']}"
+        key = entry.get("id") or (entry_url and _video_id_from_url(entry_url)) or entry_url
+        if entry_url and key not in seen:
+            seen.add(key)
+            urls.append(entry_url)
+    if limit is not None and len(urls) > limit:
+        print(f"Downloading only the first {limit} of the {len(urls)} playlist entries.")
+        urls = urls[:limit]
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        results = list(pool.map(lambda u: download_video(u, output_path, progress_callback, native=True), urls))
+    return _collect(results)
+
+
+def _collect(results) -> List[str]:
+    files = []
+    for result in results:
+        if result.startswith("Error:"):
+            print(result)
+        else:
+            files.append(result)
+    return files
@@ -146,7 +146,10 @@ class FriendlyAudioCLI:
                 from djskrewcore.yt_downloader import download_video
                 url = file_path
                 output_path = "."
-                file_path = download_video(url, output_path)
+                file_path = download_video(url, output_path, native=True)
+                if file_path.startswith("Error:"):
+                    print(file_path)
+                    return
 
         # Create audio manager
         audio_manager = AudioManager(file_path)
@@ -0,0 +1,104 @@
+import sys
+import time
+from djskrewcore.audio import AudioManager
+from djskrewcore.pcmstore import read_audio
+from djskrewcore.mixer import Deck, DeckMixer
+from cli import InputHandler
+
+class MixController:
+    def __init__(self, file_paths):
+        self.managers = [AudioManager(file_path) for file_path in file_paths]
+        self.mixer = DeckMixer(self.managers[0].sr)
+        for manager in self.managers:
+            manager.wait_until_loaded()
+            self.mixer.add_deck(Deck(manager.y, manager.sr))
+
+    def process_instructions(self, instructions: str) -> bool:
+        instructions = instructions.strip()
+        # "<deck>>instructions" edits a deck with the usual effect commands
+        if '>' in instructions:
+            deck, edit = instructions.split('>', 1)
+            return self._edit_deck(int(deck) - 1, edit)
+
+        for instruction in instructions.split(';'):
+            if not instruction.strip():
+                continue
+            parts = instruction.strip().split(':')
+            command, values = parts[0], [float(v) for v in parts[1:] if v]
+            if command == 'q':
+                return False
+            elif command == 'p':
+                self.mixer.toggle_playback()
+            elif command == 'x' and values:
+                self.mixer.set_crossfader(values[0])
+            elif command == 'g' and len(values) >= 2:
+                self.mixer.set_gain(int(values[0]) - 1, values[1])
+            elif command == 'sync' and values:
+                self.mixer.sync(int(values[0]) - 1)
+            elif command == 'fade':
+                self.mixer.crossfade(values[0] if values else 8)
+            elif command == 'h':
+                print_controls()
+            elif command == 'd':
+                self._print_decks()
+            elif command == 'i':
+                print(self.mixer.metrics.report())
+            else:
+                print(f"Warning: Unknown mixer command '{instruction}'.")
+        return True
+
+    def _edit_deck(self, index: int, instructions: str) -> bool:
+        manager = self.managers[index]
+        manager.process_instructions(instructions)
+        audio, sr = read_audio(manager.working_file)
+        self.mixer.replace_deck_audio(index, audio, sr)
+        print(f"Deck {index + 1} updated.")
+        return True
+
+    def _print_decks(self):
+        for i, deck in enumerate(self.mixer.decks):
+            master = " (master)" if i == self.mixer.master else ""
+            print(f"Deck {i + 1}{master}: side={deck.side} bpm={deck.bpm:.1f} rate={deck.rate:.3f} gain={deck.gain:.2f}")
+        print(f"Crossfader: {self.mixer.crossfader:.2f}")
+
+    def cleanup(self):
+        self.mixer.pause_playback()
+        for manager in self.managers:
+            manager.cleanup()
+
+def print_controls():
+    """Print available mixer controls"""
+    print("\nControls:")
+    print("q; - Quit the program")
+    print("p; - Toggle playback")
+    print("x:<0-1>; - Set the crossfader (0 = deck 1, 1 = deck 2)")
+    print("g:<deck>:<gain>; - Set a deck's gain")
+    print("sync:<deck>; - Match a deck's tempo and beat phase to deck 1")
+    print("fade:<beats>; - Crossfade to the other side over N beats, starting on the next beat")
+    print("d; - Show deck status")
+    print("i; - Show playback health (callback timing, xruns, lock waits)")
+    print("<deck>>command; - Apply effects to a deck, e.g. 2>p:-2;")
+    print("h; - Print this help message")
+
+def main():
+    if len(sys.argv) < 3:
+        print("Usage: python mix.py <track1> <track2> [more tracks...]")
+        return
+
+    controller = MixController(sys.argv[1:])
+    print(f"\nLoaded {len(controller.managers)} decks.")
+    print_controls()
+
+    handler = InputHandler(controller)
+    try:
+        handler.start()
+        while handler.running:
+            time.sleep(0.1)
+    except KeyboardInterrupt:
+        print("\nExiting...")
+    finally:
+        handler.stop()
+        controller.cleanup()
+
+if __name__ == "__main__":
+    main()
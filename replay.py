@@ -0,0 +1,124 @@
+import os
+import sys
+import json
+import argparse
+from time import perf_counter, sleep
+from typing import Optional
+from djskrewcore.audio import AudioManager
+from djskrewcore.recorder import read_session
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Commands that need a listener; replays run headless
+SKIPPED_COMMANDS = {'p;'}
+
+def peak_rss_bytes(who: str = 'self') -> Optional[int]:
+    """Peak RSS of this process, or of its finished children such as the render worker"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF if who == 'self' else resource.RUSAGE_CHILDREN).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+def disk_usage(directory: str) -> int:
+    total = 0
+    for root, _, files in os.walk(directory):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+def megabytes(value: Optional[int]) -> str:
+    return "n/a" if value is None else f"{value / 1024 ** 2:.1f} MB"
+
+def replay(session_path: str, input_file: Optional[str] = None, realtime: bool = False) -> dict:
+    header, entries = read_session(session_path)
+    input_file = input_file or header['input']
+
+    start = perf_counter()
+    manager = AudioManager(input_file, quality=header.get('quality', 'final'))
+    manager.wait_until_loaded()
+    load_seconds = perf_counter() - start
+
+    commands = []
+    peak_disk = disk_usage(manager.temp_dir)
+    replay_start = perf_counter()
+    try:
+        for entry in entries:
+            instructions = entry['instructions']
+            if realtime:
+                # Keep the recorded pauses, e.g. to include background work in between
+                delay = entry['t'] - (perf_counter() - replay_start)
+                if delay > 0:
+                    sleep(delay)
+            if instructions.strip() in SKIPPED_COMMANDS:
+                commands.append({'instructions': instructions, 'skipped': True})
+                continue
+            started = perf_counter()
+            keep_going = manager.process_instructions(instructions)
+            seconds = perf_counter() - started
+            temp_bytes = disk_usage(manager.temp_dir)
+            peak_disk = max(peak_disk, temp_bytes)
+            commands.append({
+                'instructions': instructions,
+                'seconds': seconds,
+                'recorded_seconds': entry.get('seconds'),
+                'temp_bytes': temp_bytes,
+            })
+            if not keep_going:
+                break
+    finally:
+        total_seconds = perf_counter() - replay_start
+        manager.cleanup()
+
+    return {
+        'session': os.path.abspath(session_path),
+        'input': os.path.abspath(input_file),
+        'load_seconds': load_seconds,
+        'total_seconds': total_seconds,
+        'command_seconds': sum(c.get('seconds', 0.0) for c in commands),
+        'peak_rss_bytes': peak_rss_bytes(),
+        'peak_worker_rss_bytes': peak_rss_bytes('children'),
+        'peak_temp_bytes': peak_disk,
+        'commands': commands,
+    }
+
+def print_report(report: dict) -> None:
+    print(f"\nReplayed {len(report['commands'])} commands on {report['input']}")
+    print(f"{'#':>3} {'seconds':>8} {'recorded':>8} {'temp':>10}  instructions")
+    for i, command in enumerate(report['commands'], start=1):
+        if command.get('skipped'):
+            print(f"{i:>3} {'skipped':>8} {'':>8} {'':>10}  {command['instructions']}")
+            continue
+        recorded = command['recorded_seconds']
+        recorded = "" if recorded is None else f"{recorded:.3f}"
+        print(f"{i:>3} {command['seconds']:>8.3f} {recorded:>8} {megabytes(command['temp_bytes']):>10}  "
+              f"{command['instructions']}")
+    print(f"\nLoad: {report['load_seconds']:.3f}s")
+    print(f"Commands: {report['command_seconds']:.3f}s (total {report['total_seconds']:.3f}s)")
+    print(f"Peak RSS: {megabytes(report['peak_rss_bytes'])} "
+          f"(render worker {megabytes(report['peak_worker_rss_bytes'])})")
+    print(f"Peak temp disk: {megabytes(report['peak_temp_bytes'])}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a recorded session headless and report its performance")
+    parser.add_argument("session", help="Session log written with cli.py --record <path>")
+    parser.add_argument("--input", help="Audio file to replay against (default: the recorded one)")
+    parser.add_argument("--realtime", action="store_true", help="Keep the recorded time between commands")
+    parser.add_argument("--json", help="Also write the report to this file")
+    args = parser.parse_args()
+
+    report = replay(args.session, args.input, args.realtime)
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report saved as: {args.json}")
+
+if __name__ == "__main__":
+    main()